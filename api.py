@@ -0,0 +1,132 @@
+# api.py
+
+import json
+import os
+import sys
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import cache
+import database
+import metrics
+from config import API_HOST, API_PORT, API_MAX_AGE_SECONDS
+from timeutil import to_day, from_day, format_minutes, week_bounds, MINUTES_PER_DAY
+
+# 출입문 디스플레이, 챗봇용 읽기 전용 예약 현황 서비스 (Streamlit 없이 database.py만 사용).
+#   GET /occupancy?date=YYYY-MM-DD   하루 예약/빈 시간을 예약 대상별로 (date 생략 시 오늘)
+#   GET /occupancy?week=YYYY-MM-DD   그 날짜가 속한 주(월~일)
+#   &resource=ID                      한 대상만
+#   GET /metrics                      Prometheus 텍스트 형식 지표
+# 응답에는 DB 변경 세대로 만든 ETag가 붙고, If-None-Match가 같으면 조회 없이 304를 돌려준다.
+# 사용법: python api.py [port]
+
+# 재시작하면 세대 번호가 처음부터 다시 시작하므로 프로세스마다 다른 값을 ETag에 섞는다
+_BOOT = f"{os.getpid():x}{int(time.time()):x}"
+
+
+def etag():
+    return '"{}-{}"'.format(_BOOT, '.'.join(map(str, cache.version('reservations', 'archives', 'resources'))))
+
+
+def _resource_json(resource, rows):
+    # rows: (team, start_min, end_min) 시작 시간 순
+    free = []
+    cursor = 0
+    for _, start, end in rows:
+        if start > cursor:
+            free.append({'start': format_minutes(cursor), 'end': format_minutes(start)})
+        cursor = max(cursor, end)
+    if cursor < MINUTES_PER_DAY:
+        free.append({'start': format_minutes(cursor), 'end': format_minutes(MINUTES_PER_DAY)})
+    return {
+        'id': resource.id,
+        'name': resource.name,
+        'reservations': [{'team': team, 'start': format_minutes(start), 'end': format_minutes(end)} for team, start, end in rows],
+        'free': free,
+    }
+
+
+def occupancy(first_day, last_day, resource_id=None):
+    # first_day ~ last_day 날짜별, 대상별 예약과 빈 시간 (대상 수와 관계없이 조회 한 번)
+    resources = [r for r in database.get_resources() if resource_id is None or r.id == resource_id]
+    if not resources:
+        raise ValueError(f"Unknown resource: {resource_id}")
+    frame = database.get_reservations(start_date=first_day, end_date=last_day, resource_id=resource_id,
+                                      columns=('resource_id', 'day', 'team', 'start_min', 'end_min'))
+    rows = {(r.id, day): [] for day in range(first_day, last_day + 1) for r in resources}
+    for resource, day, team, start, end in frame.itertuples(index=False, name=None):
+        rows[int(resource), int(day)].append((team, int(start), int(end)))
+    return [{'date': str(from_day(day)), 'resources': [_resource_json(r, rows[r.id, day]) for r in resources]}
+            for day in range(first_day, last_day + 1)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "LabReservationAPI/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        route = url.path.strip('/') if url.path in ('/occupancy', '/metrics', '/health') else 'unknown'
+        with metrics.timer(f'api.{route}'):
+            if url.path == '/occupancy':
+                self._occupancy(query)
+            elif url.path == '/metrics':
+                self._send(200, metrics.prometheus_text().encode(), 'text/plain; version=0.0.4')
+            elif url.path == '/health':
+                self._json(200, {'status': 'ok'})
+            else:
+                self._json(404, {'error': 'not found'})
+
+    def _occupancy(self, query):
+        tag = etag()
+        if tag in [value.strip() for value in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, b'', None, tag)
+            return
+        try:
+            resource_id = int(query['resource'][0]) if 'resource' in query else None
+            if 'week' in query:
+                first_day, last_day = week_bounds(to_day(query['week'][0]))
+                body = {'week_start': str(from_day(first_day)), 'days': occupancy(first_day, last_day, resource_id)}
+            else:
+                day = to_day(query.get('date', [date.today().isoformat()])[0])
+                body = occupancy(day, day, resource_id)[0]
+        except ValueError as e:
+            self._json(400, {'error': str(e)})
+            return
+        self._json(200, body, tag)
+
+    def _json(self, status, body, tag=None):
+        self._send(status, json.dumps(body, ensure_ascii=False).encode(), 'application/json; charset=utf-8', tag)
+
+    def _send(self, status, payload, content_type, tag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        if tag:
+            self.send_header('ETag', tag)
+            self.send_header('Cache-Control', f'max-age={API_MAX_AGE_SECONDS}')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_request(self, code='-', size='-'):
+        # 폴링 요청마다 접근 로그를 남기지 않는다 (4xx/5xx 응답만 표준 에러로). log_error 등 다른 로그는 그대로 둔다
+        if isinstance(code, int) and code < 400:
+            return
+        super().log_request(code, size)
+
+
+def make_server(host=API_HOST, port=API_PORT):
+    database.init_db()
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == '__main__':
+    server = make_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else API_PORT)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}/occupancy")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,67 +1,44 @@
+import bootstrap
+bootstrap.mark('script_start')
 import streamlit as st
-import pandas as pd
-import sqlite3
-import plotly.graph_objects as go
 from datetime import datetime, date, timedelta, time
-from streamlit_option_menu import option_menu
-from config import PRIMARY_COLOR, SECONDARY_COLOR, ACCENT_COLOR, BACKGROUND_COLOR, TEXT_COLOR, DATABASE_FILE
-from database import add_user, check_user, init_db, update_user, get_reservations, get_connection, insert_reservation
-from streamlit_modal import Modal
-import pytz
+from config import PRIMARY_COLOR, SECONDARY_COLOR, ACCENT_COLOR, BACKGROUND_COLOR, TEXT_COLOR, DATABASE_FILE, WEEKLY_QUOTA_HOURS, RESERVATION_PAGE_SIZE, ARCHIVE_RETENTION_DAYS, TEAM_COLORS, SESSION_COOKIE_NAME, SESSION_TTL_SECONDS
+from database import (User, add_user, check_user, update_user, get_reservations, get_resources, add_resource,
+                      get_occupancy, get_users, user_cursor, reservation_cursor, recurring_slots, find_free_windows,
+                      delete_reservations, shift_reservations, reassign_reservations, edit_reservations,
+                      DEFAULT_RESERVATION_COLUMNS)
+from writer import reserve, reserve_many, modify
+import json
+import cache
+import metrics
+from auth import sessions
+from metrics import instrument
+from timeutil import from_day, format_minutes, to_minutes, to_end_minutes
 import os
-import requests
-from github import Github
+# plotly, pytz, streamlit_option_menu는 해당 화면을 그릴 때, PyGithub/requests는 GitHub와 통신할 때만 불러온다
+bootstrap.mark('imports_done')
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-REPO_NAME = "kamgaa/lab_reservation"
-
-def download_db_from_github():
-    url = "https://github.com/kamgaa/lab_reservation/raw/main/reservation.db"
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open("reservation.db", "wb") as f:
-            f.write(response.content)
-    else:
-        print("Failed to download database file from GitHub.")
-
-def upload_db_to_github():
-    g = Github(GITHUB_TOKEN)
-    repo = g.get_repo(REPO_NAME)
-    with open("reservation.db", "rb") as file:
-        content = file.read()
-    try:
-        contents = repo.get_contents("reservation.db")
-        repo.update_file(contents.path, "Update reservation database", content, contents.sha)
-    except:
-        repo.create_file("reservation.db", "Create reservation database", content)
-
-if not os.path.exists("reservation.db"):
-    try:
-        download_db_from_github()
-    except Exception as e:
-        st.error(f"Failed to download database from GitHub: {e}")
-        # 데이터베이스 파일이 없는 경우 새로 생성
-        init_db()
-
-
-TEAM_COLORS = {
-    "CAD_UAV": "#FF5733",
-    "Palletrone": "#33FF57",
-    "Ja!warm": "#3357FF",
-    "Crazyflie": "#FF33A8"
-}
 
 # 페이지 설정
 st.set_page_config(page_title="실험실 예약 시스템", layout="wide")
 
-# 데이터베이스 초기화
-init_db()
-
-# 예제: 예약을 저장할 때 데이터베이스를 GitHub에 업로드합니다.
-def save_reservation(student_id, start_time, end_time, reservation_date):
-    insert_reservation(student_id, start_time, end_time, reservation_date)
-    upload_db_to_github()
-
+# 데이터베이스 준비 (파일이 없으면 GitHub에서 받아오고, 프로세스당 한 번 마이그레이션)를 백그라운드에서 진행
+bootstrap.start()
+if not bootstrap.wait(timeout=0.5):
+    with st.spinner("데이터베이스를 불러오는 중입니다..."):
+        bootstrap.wait()
+if bootstrap.state() == 'failed':
+    st.error(f"데이터베이스를 준비하지 못했습니다: {bootstrap.error}")
+    st.stop()
+if bootstrap.error is not None and not st.session_state.get('bootstrap_error_shown'):
+    st.session_state['bootstrap_error_shown'] = True
+    st.error(f"Failed to download database from GitHub: {bootstrap.error}")
+
+# 커밋이 일어나면 백그라운드에서 모아서 GitHub에 스냅샷 업로드
+if GITHUB_TOKEN:
+    from persistence import start as start_persistence
+    start_persistence()
 
 # 로그인 상태 초기화
 if 'logged_in' not in st.session_state:
@@ -80,10 +57,50 @@ if 'team' not in st.session_state:
     st.session_state['team'] = None
 if 'team_color' not in st.session_state:
     st.session_state['team_color'] = None
+if 'session_token' not in st.session_state:
+    st.session_state['session_token'] = None
+if 'cookie_token' not in st.session_state:
+    # 브라우저 쿠키에 들어 있는 토큰 (페이지를 열 때 보낸 값에서 시작해 이후 쓰거나 지운 값을 따라간다)
+    cookie_token = st.context.cookies.get(SESSION_COOKIE_NAME)
+    st.session_state['cookie_token'] = cookie_token if isinstance(cookie_token, str) else None
 
 # 미리 정해진 10개의 색상
 color_palette = ['#FF5733', '#33FF57', '#3357FF', '#FF33A8', '#FF8C33', '#33FFF3', '#FF33D4', '#D433FF', '#33FF88', '#33A8FF']
 
+def start_session(user, token):
+    st.session_state['logged_in'] = True
+    st.session_state['session_token'] = token
+    st.session_state['student_id'] = user.student_id
+    st.session_state['user_name'] = user.name
+    st.session_state['team'] = user.team
+    st.session_state['team_color'] = user.team_color or color_palette[0]
+    st.session_state['is_admin'] = (user.student_id == "24510047")  # 관리자인지 확인
+    st.session_state['register'] = False  # 회원가입 상태 초기화
+
+def end_session():
+    sessions.revoke(st.session_state['session_token'])
+    st.session_state['logged_in'] = False
+    st.session_state['session_token'] = None
+    st.session_state['student_id'] = None
+    st.session_state['user_name'] = None
+    st.session_state['team'] = None
+    st.session_state['team_color'] = None
+    st.session_state['is_admin'] = False
+
+# 다시 연결된 브라우저는 쿠키에 남은 세션 토큰으로 DB 조회 없이 로그인 상태를 되살린다
+if not st.session_state['logged_in'] and st.session_state['cookie_token']:
+    resumed = sessions.resume(st.session_state['cookie_token'])
+    if resumed is not None:
+        start_session(resumed, st.session_state['cookie_token'])
+
+# 세션 토큰이 바뀌었으면 (로그인/로그아웃/만료) 쿠키를 맞춘다. 토큰은 URL에 넣지 않아 기록/Referer/공유 링크로 새지 않는다
+if st.session_state['session_token'] != st.session_state['cookie_token']:
+    token = st.session_state['session_token']
+    cookie = f"{SESSION_COOKIE_NAME}={token or ''}; path=/; max-age={SESSION_TTL_SECONDS if token else 0}; SameSite=Strict"
+    st.html(f"<script>document.cookie = {json.dumps(cookie)} + (location.protocol === 'https:' ? '; Secure' : '');</script>",
+            unsafe_allow_javascript=True)
+    st.session_state['cookie_token'] = token
+
 # 로그인 페이지
 def login_page():
     st.title("로그인 페이지")
@@ -92,21 +109,15 @@ def login_page():
     if st.button("로그인"):
         user = check_user(student_id, password)
         if user:
-            st.session_state['logged_in'] = True
-            st.session_state['student_id'] = user[1]  # student_id
-            st.session_state['user_name'] = user[2]  # name
-            st.session_state['team'] = user[4] if len(user) > 4 else None  # team (user[3] 인덱스는 password)
-            st.session_state['team_color'] = user[5] if len(user) > 5 else color_palette[0]  # team_color
-            st.session_state['is_admin'] = (student_id == "24510047")  # 관리자인지 확인
-            st.session_state['register'] = False  # 회원가입 상태 초기화
+            start_session(user, sessions.issue(user))
 
             st.success("로그인 성공")
-            st.experimental_rerun()
+            st.rerun()
         else:
             st.error("학번이나 비밀번호가 올바르지 않습니다.")
     if st.button("회원가입"):
         st.session_state['register'] = True
-        st.experimental_rerun()
+        st.rerun()
 
 # 회원가입 페이지
 def register_page():
@@ -119,46 +130,137 @@ def register_page():
     if st.button("회원가입", key="register_button"):
         if len(new_student_id) == 8 and new_student_id.isdigit() and all('\uAC00' <= char <= '\uD7A3' for char in new_name):
             team_color = TEAM_COLORS[new_team]
-            add_user(new_student_id, new_name, new_password, new_team, team_color)
-            st.success("회원가입이 완료되었습니다.")
-            st.session_state['register'] = False  # 회원가입 완료 후 로그인 페이지로 이동
-            st.experimental_rerun()
+            if add_user(new_student_id, new_name, new_password, new_team, team_color):
+                st.success("회원가입이 완료되었습니다.")
+                st.session_state['register'] = False  # 회원가입 완료 후 로그인 페이지로 이동
+                st.rerun()
+            else:
+                st.error("이미 가입된 학번입니다.")
         else:
             st.error("유효한 학번(8자리 숫자)과 이름(한글)을 입력해주세요.")
     if st.button("로그인 페이지로 돌아가기", key="back_to_login_button"):
         st.session_state['register'] = False
-        st.experimental_rerun()
+        st.rerun()
 
-def get_reserved_time(team):
-    conn = get_connection()
+def get_reserved_time(team, resource_id):
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday())  # 월요일
     end_of_week = start_of_week + timedelta(days=6)  # 일요일
 
-    query = """
-        SELECT * FROM reservations
-        WHERE student_id IN (SELECT student_id FROM users WHERE team = ?)
-        AND reservation_date BETWEEN ? AND ?
-    """
-    df = pd.read_sql_query(query, conn, params=(team, start_of_week, end_of_week))
-    conn.close()
-
-    total_reserved_time = 0
-    for _, row in df.iterrows():
-        start_time = datetime.strptime(row['start_time'], '%H:%M').time()
-        end_time = datetime.strptime(row['end_time'], '%H:%M').time()
-        reserved_hours = (datetime.combine(date.min, end_time) - datetime.combine(date.min, start_time)).seconds / 3600
-        total_reserved_time += reserved_hours
-
-    return total_reserved_time
+    return get_occupancy().team_hours(team, start_of_week, end_of_week, resource_id)
+
+def resource_picker():
+    # 예약할 대상(실험실, 장비) 선택. 중복 확인과 주간 할당량은 대상마다 따로 적용된다
+    resources = get_resources()
+    ids = [resource.id for resource in resources]
+    current = st.session_state.get('resource_id')
+    resource_id = st.selectbox("예약 대상", options=ids, index=ids.index(current) if current in ids else 0,
+                               format_func=lambda i: resources[ids.index(i)].name, key="resource_select")
+    st.session_state['resource_id'] = resource_id
+    return resources[ids.index(resource_id)]
+def page_cursor(key):
+    # 이전 페이지로 돌아갈 수 있도록 지나온 페이지의 커서를 세션에 쌓아 둔다
+    if key not in st.session_state:
+        st.session_state[key] = [None]
+    return st.session_state[key][-1]
+
+def pager(key, next_cursor):
+    cursors = st.session_state[key]
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("이전", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.write(f"{len(cursors)} 페이지")
+    with col_next:
+        if st.button("다음", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def reservation_list(resource_id):
+    # 다가오는 예약을 바로 볼 수 있도록 오늘부터의 예약만 날짜 순으로 보여준다
+    key = f'reservation_page_cursors_{resource_id}'
+    page = get_reservations(start_date=date.today(), after=page_cursor(key), limit=RESERVATION_PAGE_SIZE,
+                            resource_id=resource_id)
+    st.dataframe(page[list(DEFAULT_RESERVATION_COLUMNS)])
+    pager(key, reservation_cursor(page, RESERVATION_PAGE_SIZE))
+
+WEEKDAY_NAMES = ["월", "화", "수", "목", "금", "토", "일"]
+
+def recurring_booking(time_slots, resource_id):
+    tomorrow = date.today() + timedelta(days=1)
+    col_start, col_end = st.columns(2)
+    with col_start:
+        first_date = st.date_input("시작 날짜", value=tomorrow, min_value=tomorrow, key="recurring_start_date")
+    with col_end:
+        last_date = st.date_input("종료 날짜", value=first_date + timedelta(weeks=4), min_value=first_date, key="recurring_end_date")
+    weekdays = st.multiselect("요일", options=list(range(7)), format_func=lambda day: WEEKDAY_NAMES[day], key="recurring_weekdays")
+    start_time = st.selectbox("시작 시간", options=time_slots, index=time_slots.index('14:00'), key="recurring_start_time")
+    end_time = st.selectbox("종료 시간", options=time_slots, index=time_slots.index('16:00'), key="recurring_end_time")
+    partial = st.checkbox("예약 가능한 날짜만 예약 (체크하지 않으면 모두 가능할 때만 예약)", key="recurring_partial")
+
+    if st.button("반복 예약하기", key="recurring_confirm_button"):
+        slots = recurring_slots(first_date, last_date, set(weekdays), start_time, end_time)
+        if not slots:
+            st.error("선택한 기간에 해당하는 요일이 없습니다.")
+            return
+        results = reserve_many(st.session_state['student_id'], slots, all_or_nothing=not partial, resource_id=resource_id)
+        accepted = sum(result.accepted for result in results)
+        if accepted == len(slots):
+            st.success(f"{accepted}건 예약되었습니다.")
+        elif accepted:
+            st.warning(f"{len(slots)}건 중 {accepted}건만 예약되었습니다.")
+        else:
+            st.error("예약하지 못했습니다.")
+
+        import pandas as pd
+        st.dataframe(pd.DataFrame([
+            {'날짜': str(slot_date), '시작 시간': slot_start, '종료 시간': slot_end,
+             '결과': "예약 완료" if result.accepted else result.reason}
+            for (slot_date, slot_start, slot_end), result in zip(slots, results)
+        ]))
+
+def free_slot_search(first_date, earliest_min, resource_id):
+    # 점유 인덱스에서 연속으로 비어 있는 시간을 찾아 보여주고, 고른 구간의 앞부분을 바로 예약한다
+    col_start, col_end, col_hours, col_count = st.columns(4)
+    with col_start:
+        search_start = st.date_input("검색 시작", value=first_date, min_value=first_date, key="free_search_start")
+    with col_end:
+        search_end = st.date_input("검색 종료", value=search_start + timedelta(weeks=4), min_value=search_start, key="free_search_end")
+    with col_hours:
+        hours = st.number_input("최소 시간", min_value=0.5, max_value=24.0, value=2.0, step=0.5, key="free_search_hours")
+    with col_count:
+        count = st.number_input("개수", min_value=1, max_value=50, value=10, key="free_search_count")
+
+    windows = find_free_windows(st.session_state['team'], search_start, search_end, hours, int(count),
+                                earliest_min if search_start == first_date else 0, resource_id)
+    if not windows:
+        st.info("조건에 맞는 빈 시간이 없습니다.")
+        return
+    labels = [f"{from_day(w.day)} {format_minutes(w.start_min)} ~ {format_minutes(w.end_min)}" for w in windows]
+    choice = st.radio("빈 시간", options=range(len(windows)), format_func=lambda i: labels[i], key="free_search_choice")
+    window = windows[choice]
+    end_min = window.start_min + round(hours * 60)
+    if st.button(f"{from_day(window.day)} {format_minutes(window.start_min)} ~ {format_minutes(end_min)} 예약하기", key="free_search_book"):
+        result = reserve(st.session_state['student_id'], window.start_min, end_min, window.day, resource_id)
+        if result.accepted:
+            st.success("예약이 완료되었습니다.")
+            st.rerun()
+        else:
+            st.error(result.reason)
+
 # 메인 페이지
 #import plotly.graph_objects as go
 
+@instrument('page.main_page')
 def main_page():
     #st.set_page_config(page_title="실험실 예약 시스템", layout="wide")
     st.title("실험실 예약 시스템")
     st.write(f"환영합니다, {st.session_state['user_name']}님 (학번: {st.session_state['student_id']})")
 
+    from streamlit_option_menu import option_menu
+
     # 사이드바 메뉴
     with st.sidebar:
         selected = option_menu(
@@ -168,25 +270,32 @@ def main_page():
             menu_icon="menu-button-wide",
             default_index=0,
         )
+        if st.button("로그아웃", key="logout_button"):
+            end_session()
+            st.rerun()
 
     if selected == "예약":
         st.subheader("예약 페이지")
-        
+
+        # 예약 대상 선택
+        resource = resource_picker()
+
         # 날짜 선택
         selected_date = st.date_input("예약 날짜를 선택하세요", value=date.today(), min_value=date.today())
         st.session_state['selected_date'] = selected_date
 
-        # 현재 팀의 예약된 시간 계산
-        reserved_time = get_reserved_time(st.session_state['team'])
-        remaining_time = 24 - reserved_time
+        # 현재 팀이 이 대상을 예약한 시간 계산
+        reserved_time = get_reserved_time(st.session_state['team'], resource.id)
+        remaining_time = resource.weekly_quota_hours - reserved_time
 
         if remaining_time <= 0:
-            st.warning("이번 주에 더 이상 예약할 수 없습니다.")
+            st.warning(f"이번 주에 {resource.name}을(를) 더 이상 예약할 수 없습니다.")
             return
 
-        st.write(f"이번 주 예약 가능 시간: {remaining_time} 시간")
+        st.write(f"이번 주 {resource.name} 예약 가능 시간: {remaining_time} 시간")
 
         # 한국 시간대 설정
+        import pytz
         kst = pytz.timezone('Asia/Seoul')
         #current_time_kst = datetime.now(kst)
         
@@ -207,104 +316,59 @@ def main_page():
         start_time = st.selectbox("시작 시간", options=time_slots, index=time_slots.index(current_time_str))
         end_time = st.selectbox("종료 시간", options=time_slots, index=time_slots.index((next_half_hour + timedelta(hours=1)).strftime('%H:%M')))
 
-        start_time_dt = datetime.strptime(start_time, '%H:%M').time()
-        end_time_dt = datetime.strptime(end_time, '%H:%M').time()
+        # 저장할 때와 같은 변환을 쓴다 (종료 00:00은 자정)
+        start_min = to_minutes(start_time)
+        end_min = to_end_minutes(end_time, start_min)
 
-        if start_time_dt >= end_time_dt:
+        if start_min >= end_min:
             st.error("종료 시간은 시작 시간 이후여야 합니다.")
-        elif selected_date == date.today() and start_time_dt <= datetime.now().time():
+        elif selected_date == date.today() and start_min <= to_minutes(datetime.now()):
             st.error("현재 시간 이후로 예약할 수 있습니다.")
         else:
             # 중복 예약 방지 로직 추가
-            conn = get_connection()
-            overlapping_reservations = pd.read_sql_query("""
-                SELECT * FROM reservations 
-                WHERE reservation_date = ? 
-                AND (
-                    (start_time < ? AND end_time > ?)
-                )
-            """, conn, params=(selected_date, end_time, start_time))
-            conn.close()
-
-            if overlapping_reservations.empty:
+            if get_occupancy().is_free(selected_date, start_min, end_min, resource.id):
                 # 예약 시간 검증 및 설정
-                reservation_duration = (datetime.combine(date.today(), end_time_dt) - datetime.combine(date.today(), start_time_dt)).seconds / 3600
+                reservation_duration = (end_min - start_min) / 60
                 if reservation_duration > remaining_time:
                     st.error(f"남은 예약 가능 시간을 초과했습니다. 남은 시간: {remaining_time} 시간")
                 else:
                     # 예약 버튼
                     if st.button("예약하기", key="reservation_confirm_button"):
-                        insert_reservation(st.session_state['student_id'], start_time, end_time, selected_date)
-                        st.success("예약이 완료되었습니다.")
-                        st.experimental_rerun()
+                        # 중복/할당량 확인과 저장은 writer 스레드에서 하나의 트랜잭션으로 처리
+                        result = reserve(st.session_state['student_id'], start_min, end_min, selected_date, resource.id)
+                        if result.accepted:
+                            st.success("예약이 완료되었습니다.")
+                            st.rerun()
+                        else:
+                            st.error(result.reason)
             else:
                 st.error("다른 팀이 이미 해당 시간에 예약을 했습니다.")
 
-        # 예약 목록 표시
+        # 빈 시간 찾기 (예약 시작은 다음 30분 단위부터)
+        with st.expander("빈 시간 찾기"):
+            free_slot_search(next_half_hour.date(), next_half_hour.hour * 60 + next_half_hour.minute, resource.id)
+
+        # 반복 예약 (여러 날짜를 한 번에 확인/저장)
+        with st.expander("반복 예약"):
+            recurring_booking(time_slots, resource.id)
+
+        # 예약 목록 표시 (keyset 페이지네이션)
         st.subheader("예약 목록")
-        reservations = get_reservations()
-        st.dataframe(reservations)
+        reservation_list(resource.id)
 
-        # 예약 현황 바 차트
+        # 예약 현황 바 차트 (선택한 날짜의 모든 대상 예약을 한 번만 조회)
         st.subheader(f"{selected_date} 예약 현황")
-        filtered_reservations = reservations[reservations['reservation_date'] == selected_date.strftime('%Y-%m-%d')]
-        
-        # 예약 데이터를 시간대별로 그룹화
-        time_blocks = [(datetime.combine(selected_date, time(hour, 0)), datetime.combine(selected_date, time(hour + 1 if hour < 23 else 0, 0))) for hour in range(24)]
-        reservation_summary = {block[0]: [] for block in time_blocks}
-
-        for _, row in filtered_reservations.iterrows():
-            reservation_start = datetime.combine(selected_date, datetime.strptime(row['start_time'], '%H:%M').time())
-            reservation_end = datetime.combine(selected_date, datetime.strptime(row['end_time'], '%H:%M').time())
-            for block_start, block_end in time_blocks:
-                if reservation_start < block_end and reservation_end > block_start:
-                    reservation_summary[block_start].append(row['team'])
-
-        bar_data = []
-        for block_start, teams in reservation_summary.items():
-            team_counts = {team: teams.count(team) for team in set(teams)}
-            for team, count in team_counts.items():
-                bar_data.append({
-                    'time': block_start.strftime('%H:%M'),
-                    'team': team,
-                    'count': 1  # 예약 건수는 1로 고정
-                })
-
-        bar_df = pd.DataFrame(bar_data)
-
-        # 00시부터 24시까지 모든 시간을 보여주기 위해 빈 데이터도 포함
-        empty_time_slots = [{'time': block_start.strftime('%H:%M'), 'team': '', 'count': 0} for block_start, _ in reservation_summary.items()]
-        empty_df = pd.DataFrame(empty_time_slots)
-
-        # 예약 데이터와 빈 데이터를 병합
-        bar_df = pd.concat([bar_df, empty_df]).drop_duplicates(subset=['time', 'team']).reset_index(drop=True)
-
-        if not bar_df.empty:
-            fig = go.Figure()
-
-            for team in bar_df['team'].unique():
-                team_data = bar_df[bar_df['team'] == team]
-                fig.add_trace(go.Bar(
-                    x=team_data['time'],
-                    y=team_data['count'],
-                    name=team,
-                    marker=dict(color=team_data['time'].apply(lambda x: TEAM_COLORS[team] if team in TEAM_COLORS else 'gray')),
-                    showlegend=False if team == '' else True,  # 빈 팀은 레전드 표시 안 함
-                    #width=0.8
-                ))
-
-            fig.update_layout(
-                title=f"{selected_date} 팀별 예약 현황",
-                xaxis_title="예약 시간",
-                yaxis_title=" ",
-                yaxis=dict(tickvals=[1], ticktext=['1']),
-                barmode='stack',
-                xaxis=dict(type='category', categoryorder='category ascending')#, tickangle=0, dtick=2)
-            )
-
-            st.plotly_chart(fig)
-        else:
-            st.write("선택한 날짜에 예약이 없습니다.")
+        day_reservations = get_reservations(start_date=selected_date, end_date=selected_date,
+                                            columns=('resource_id', 'resource', 'team', 'start_min', 'end_min'))
+
+        # 선택한 대상은 팀 × 30분 슬롯 점유 행렬로, 전체 대상은 대상별 타임라인으로 그린다
+        from charts import daily_occupancy_figure, resource_occupancy_figure
+        fig = daily_occupancy_figure(day_reservations[day_reservations['resource_id'] == resource.id],
+                                     f"{selected_date} {resource.name} 팀별 예약 현황", TEAM_COLORS)
+        st.plotly_chart(fig)
+        fig = resource_occupancy_figure(day_reservations, [r.name for r in get_resources()],
+                                        f"{selected_date} 대상별 예약 현황", TEAM_COLORS)
+        st.plotly_chart(fig)
 
     elif selected == "마이 페이지":
         my_page()
@@ -313,6 +377,7 @@ def main_page():
 
     
 # 마이 페이지
+@instrument('page.my_page')
 def my_page():
     st.subheader("마이 페이지")
     st.write(f"환영합니다, {st.session_state['user_name']}님 (학번: {st.session_state['student_id']}, 팀: {st.session_state['team']}, 팀 컬러: {st.session_state['team_color']})")
@@ -328,107 +393,238 @@ def my_page():
         
         if st.button("저장", key="save_profile"):
             team_color = TEAM_COLORS[new_team]
-            update_user(st.session_state['student_id'], new_name, new_team, new_student_id, team_color)
-            st.session_state['user_name'] = new_name
-            st.session_state['team'] = new_team
-            st.session_state['student_id'] = new_student_id
-            st.session_state['team_color'] = team_color
-            st.success("개인정보가 수정되었습니다.")
-            st.session_state['edit_profile'] = False
-            st.experimental_rerun()
-
-    # 현재 팀의 예약된 시간 계산 및 표시
-    reserved_time = get_reserved_time(st.session_state['team'])
-    remaining_time = 24 - reserved_time
-
-    st.write(f"이번 주 예약 가능 시간: {remaining_time} 시간")
-    st.write(f"이번 주 예약한 시간: {reserved_time} 시간")
-
-    # 가로 바 그래프
+            if not update_user(st.session_state['student_id'], new_name, new_team, new_student_id, team_color):
+                st.error("이미 가입된 학번입니다.")
+            else:
+                user = sessions.resume(st.session_state.get('session_token'))
+                if user is not None:
+                    sessions.update(st.session_state['session_token'],
+                                    User(user.id, new_student_id, new_name, new_team, team_color))
+                st.session_state['user_name'] = new_name
+                st.session_state['team'] = new_team
+                st.session_state['student_id'] = new_student_id
+                st.session_state['team_color'] = team_color
+                st.success("개인정보가 수정되었습니다.")
+                st.session_state['edit_profile'] = False
+                st.rerun()
+
+    # 현재 팀의 대상별 예약된 시간 계산 및 표시
+    resources = get_resources()
+    reserved_times = [get_reserved_time(st.session_state['team'], resource.id) for resource in resources]
+    remaining_times = [resource.weekly_quota_hours - reserved for resource, reserved in zip(resources, reserved_times)]
+
+    for resource, reserved_time, remaining_time in zip(resources, reserved_times, remaining_times):
+        st.write(f"{resource.name}: 이번 주 예약 가능 시간 {remaining_time} 시간, 예약한 시간 {reserved_time} 시간")
+
+    # 가로 바 그래프 (대상마다 한 줄)
+    import plotly.graph_objects as go
+    names = [resource.name for resource in resources]
     fig = go.Figure()
     fig.add_trace(go.Bar(
-        y=["시간"],
-        x=[remaining_time],
+        y=names,
+        x=remaining_times,
         name="잔여 시간",
         orientation='h',
         marker=dict(color='gray')
     ))
     fig.add_trace(go.Bar(
-        y=["시간"],
-        x=[reserved_time],
+        y=names,
+        x=reserved_times,
         name="예약한 시간",
         orientation='h',
         marker=dict(color=st.session_state['team_color'])
     ))
 
+    max_hours = max([resource.weekly_quota_hours for resource in resources] + [WEEKLY_QUOTA_HOURS])
     fig.update_layout(
         barmode='stack',
         title="이번 주 예약 가능 시간",
-        xaxis=dict(showgrid=False, tickvals=[0, 4, 8, 12, 16, 20, 24], ticktext=["0", "4", "8", "12", "16", "20", "24"]),
+        xaxis=dict(showgrid=False, tickvals=list(range(0, int(max_hours) + 1, 4))),
         yaxis=dict(showgrid=False),
         showlegend=False,
-        height=200,
+        height=160 + 40 * len(resources),
     )
 
     st.plotly_chart(fig)
 
 # 관리자 페이지
+def apply_admin_change(change, *args):
+    result = modify(change, *args)
+    if result.accepted:
+        st.success("변경되었습니다.")
+        st.rerun()
+    else:
+        st.error(result.reason or "변경하지 못했습니다.")
+
+def cache_gauges():
+    return {f"lab_cache_{name}": value for name, value in cache.stats.items()}
+
+def metrics_panel():
+    import pandas as pd
+    st.dataframe(pd.DataFrame(metrics.summary()))
+    st.write(f"캐시: {cache.stats}")
+    st.write(f"느린 쿼리 ({len(metrics.slow_queries)}건)")
+    for entry in list(metrics.slow_queries):
+        st.write(f"{entry['time']} {entry['name']} {entry['ms']}ms")
+        st.code(entry['sql'] + "\n\n" + "\n".join(entry['plan']), language="sql")
+    st.download_button("Prometheus 형식으로 내려받기", metrics.prometheus_text(cache_gauges()),
+                       file_name="metrics.prom", key="admin_metrics_download")
+    if st.button("지표 초기화", key="admin_metrics_reset"):
+        metrics.reset()
+        st.rerun()
+
+def transfer_panel():
+    import tempfile
+    import transfer
+    col_table, col_format, col_team = st.columns(3)
+    with col_table:
+        table = st.selectbox("대상", ["reservations", "users"], key="export_table")
+    with col_format:
+        fmt = st.selectbox("형식", ["csv", "parquet"], key="export_format")
+    with col_team:
+        team = st.selectbox("팀", ["전체"] + list(TEAM_COLORS), key="export_team", disabled=table == "users")
+    col_start, col_end = st.columns(2)
+    with col_start:
+        export_start = st.date_input("시작 날짜", value=None, key="export_start", disabled=table == "users")
+    with col_end:
+        export_end = st.date_input("종료 날짜", value=None, key="export_end", disabled=table == "users")
+
+    if st.button("내보내기 파일 만들기", key="export_button"):
+        # 조회 결과 전체를 메모리에 올리지 않도록 임시 파일에 chunk 단위로 쓴 뒤 내려받게 한다
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as f:
+            path = f.name
+        if table == "users":
+            rows = transfer.export_users(path, fmt)
+        else:
+            rows = transfer.export_reservations(path, fmt, export_start, export_end, None if team == "전체" else team)
+        st.session_state['export_file'] = (path, f"{table}.{fmt}", rows)
+    if st.session_state.get('export_file'):
+        path, file_name, rows = st.session_state['export_file']
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                st.download_button(f"{file_name} 내려받기 ({rows}행)", f, file_name=file_name, key="export_download")
+
+    uploaded = st.file_uploader("시간표 가져오기 (student_id, reservation_date, start_time, end_time, 선택: resource)", type=["csv", "parquet"], key="import_file")
+    skip_conflicts = st.checkbox("문제가 있는 행만 빼고 가져오기", key="import_skip_conflicts")
+    shift_weeks = st.number_input("날짜 이동 (주)", value=0, step=1, key="import_shift_weeks")
+    if uploaded is not None and st.button("가져오기", key="import_button"):
+        result = transfer.import_reservations(uploaded, skip_conflicts=skip_conflicts, shift_weeks=int(shift_weeks))
+        if result.accepted:
+            st.success(f"{result.imported}건을 가져왔습니다.")
+        else:
+            st.error(f"가져오지 못했습니다: {result.reason}")
+        if result.rejected:
+            import pandas as pd
+            st.dataframe(pd.DataFrame(result.rejected, columns=["행", "사유"]))
+
+@instrument('page.admin_page')
 def admin_page():
     st.subheader("관리자 페이지")
 
-    # 모든 유저 목록 조회
-    conn = get_connection()
-    users = pd.read_sql_query("SELECT * FROM users", conn)
-    conn.close()
-
-    # 유저 선택
-    selected_user = st.selectbox("유저를 선택하세요", users['student_id'].tolist())
-
-    if selected_user:
-        user_info = users[users['student_id'] == selected_user].iloc[0]
-        st.write(f"이름: {user_info['name']}")
-        st.write(f"학번: {user_info['student_id']}")
-        st.write(f"팀: {user_info['team']}")
-        st.write(f"팀 컬러: {user_info['team_color']}")
-
-        # 해당 유저의 예약 정보 조회
-        conn = get_connection()
-        reservations = pd.read_sql_query(f"SELECT * FROM reservations WHERE student_id = '{selected_user}'", conn)
-        conn.close()
-
-        st.write("예약 정보:")
-        for _, row in reservations.iterrows():
-            st.write(f"날짜: {row['reservation_date']}, 시작 시간: {row['start_time']}, 종료 시간: {row['end_time']}")
-
-            # 예약 수정
-            if st.button(f"수정 ({row['id']})"):
-                with st.form(key=f"edit_reservation_{row['id']}"):
-                    new_start_time = st.time_input("새 시작 시간", value=datetime.strptime(row['start_time'], '%H:%M:%S').time())
-                    new_end_time = st.time_input("새 종료 시간", value=datetime.strptime(row['end_time'], '%H:%M:%S').time())
-                    if st.form_submit_button("저장"):
-                        conn = get_connection()
-                        c = conn.cursor()
-                        c.execute("UPDATE reservations SET start_time = ?, end_time = ? WHERE id = ?", 
-                                  (new_start_time.strftime('%H:%M:%S'), new_end_time.strftime('%H:%M:%S'), row['id']))
-                        conn.commit()
-                        conn.close()
-                        st.success("예약이 수정되었습니다.")
-                        st.experimental_rerun()
-
-            # 예약 삭제
-            if st.button(f"삭제 ({row['id']})"):
-                conn = get_connection()
-                c = conn.cursor()
-                c.execute("DELETE FROM reservations WHERE id = ?", (row['id'],))
-                conn.commit()
-                conn.close()
-                st.success("예약이 삭제되었습니다.")
-                st.experimental_rerun()
+    # 유저 목록 (학번 순 페이지 단위 조회)
+    search = st.text_input("학번 또는 이름 검색", key="admin_user_search")
+    if st.session_state.get('admin_user_search_last') != search:
+        st.session_state['admin_user_search_last'] = search
+        st.session_state['admin_user_cursors'] = [None]
+    users = get_users(search=search or None, after=page_cursor('admin_user_cursors'), limit=RESERVATION_PAGE_SIZE)
+    st.dataframe(users[['student_id', 'name', 'team', 'team_color']])
+    pager('admin_user_cursors', user_cursor(users, RESERVATION_PAGE_SIZE))
+
+    col_user, col_resource = st.columns(2)
+    with col_user:
+        selected_user = st.selectbox("예약을 볼 유저", ["전체"] + users['student_id'].tolist(), key="admin_selected_user")
+    with col_resource:
+        resources = {resource.id: resource.name for resource in get_resources()}
+        selected_resource = st.selectbox("예약 대상", [None] + list(resources), key="admin_selected_resource",
+                                         format_func=lambda i: "전체" if i is None else resources[i])
+    student_id = None if selected_user == "전체" else selected_user
+    if st.session_state.get('admin_selected_user_last') != (selected_user, selected_resource):
+        st.session_state['admin_selected_user_last'] = (selected_user, selected_resource)
+        st.session_state['admin_reservation_cursors'] = [None]
+
+    # 예약 목록: 한 번의 페이지 조회 결과를 편집 표로 보여주고, 바뀐 행과 선택한 행을 한 트랜잭션으로 반영
+    columns = ['id', 'student_id', 'name', 'resource', 'reservation_date', 'start_time', 'end_time']
+    reservations = get_reservations(student_id=student_id, after=page_cursor('admin_reservation_cursors'),
+                                    limit=RESERVATION_PAGE_SIZE, columns=tuple(columns), resource_id=selected_resource)
+    table = reservations[columns].copy()
+    table.insert(0, '선택', False)
+    edited = st.data_editor(
+        table,
+        key="admin_reservation_editor",
+        hide_index=True,
+        disabled=['id', 'student_id', 'name', 'resource'],
+        column_config={
+            'reservation_date': st.column_config.TextColumn("날짜 (YYYY-MM-DD)"),
+            'start_time': st.column_config.TextColumn("시작 (HH:MM)"),
+            'end_time': st.column_config.TextColumn("종료 (HH:MM)"),
+        },
+    )
+    pager('admin_reservation_cursors', reservation_cursor(reservations, RESERVATION_PAGE_SIZE))
+
+    fields = ['reservation_date', 'start_time', 'end_time']
+    changed = (edited[fields] != table[fields]).any(axis=1)
+    selected = edited.loc[edited['선택'], 'id'].tolist()
+
+    if st.button(f"변경 사항 저장 ({int(changed.sum())}건)", key="admin_save", disabled=not changed.any()):
+        edits = list(edited.loc[changed, ['id'] + fields].itertuples(index=False, name=None))
+        apply_admin_change(edit_reservations, edits)
+
+    st.write(f"선택한 예약 {len(selected)}건")
+    col_delete, col_shift, col_reassign = st.columns(3)
+    with col_delete:
+        if st.button("선택 삭제", key="admin_delete", disabled=not selected):
+            apply_admin_change(delete_reservations, selected)
+    with col_shift:
+        minutes = st.number_input("이동할 시간 (분)", value=30, step=30, key="admin_shift_minutes")
+        if st.button("선택 시간 이동", key="admin_shift", disabled=not selected or not minutes):
+            apply_admin_change(shift_reservations, selected, minutes)
+    with col_reassign:
+        new_owner = st.text_input("새 학번", key="admin_new_owner")
+        if st.button("선택 담당자 변경", key="admin_reassign", disabled=not selected or not new_owner):
+            apply_admin_change(reassign_reservations, selected, new_owner)
+
+    # 예약 대상 (대상마다 중복 확인과 팀별 주간 할당량이 따로 적용된다)
+    with st.expander("예약 대상"):
+        import pandas as pd
+        st.dataframe(pd.DataFrame(get_resources()), hide_index=True)
+        col_name, col_quota = st.columns(2)
+        with col_name:
+            new_resource = st.text_input("새 대상 이름", key="admin_new_resource")
+        with col_quota:
+            new_quota = st.number_input("팀별 주간 예약 가능 시간", min_value=0.5, value=float(WEEKLY_QUOTA_HOURS), step=0.5,
+                                        key="admin_new_resource_quota")
+        if st.button("대상 추가", key="admin_add_resource", disabled=not new_resource):
+            if add_resource(new_resource, new_quota):
+                st.success(f"{new_resource}을(를) 추가했습니다.")
+                st.rerun()
+            else:
+                st.error("이미 있는 대상입니다.")
+
+    # 성능 지표 (이 프로세스에서 모은 값)
+    with st.expander("성능 지표"):
+        metrics_panel()
+
+    # CSV/Parquet 내보내기, 시간표 가져오기
+    with st.expander("내보내기 / 가져오기"):
+        transfer_panel()
+
+    # 지난 예약 보관 및 DB 정리
+    with st.expander("지난 예약 보관"):
+        import archive
+        st.write(f"{ARCHIVE_RETENTION_DAYS}일이 지난 예약은 보관 파일로 옮겨집니다. 보관 파일: {', '.join(archive.archive_names()) or '없음'}")
+        if st.button("지금 보관 및 정리", key="admin_archive"):
+            moved = archive.archive_reservations()
+            size = archive.compact()
+            st.success(f"{sum(moved.values())}건을 보관했습니다. 현재 DB 크기: {size / 1024:.0f}KB")
 
 # 페이지 라우팅
-if st.session_state['logged_in']:
-    main_page()
-elif st.session_state['register']:
-    register_page()
-else:
-    login_page()
+with metrics.timer('rerun'):
+    if st.session_state['logged_in']:
+        main_page()
+    elif st.session_state['register']:
+        register_page()
+    else:
+        login_page()
+# 지표 파일은 METRICS_EXPORT_INTERVAL_SECONDS마다 한 번만 새로 쓴다
+metrics.export(extra_gauges=cache_gauges())
+bootstrap.mark('first_render')
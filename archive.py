@@ -0,0 +1,193 @@
+# archive.py
+
+import os
+import sys
+import threading
+from datetime import date
+import database
+from timeutil import to_day, from_day
+from config import ARCHIVE_DIR, ARCHIVE_RETENTION_DAYS, ARCHIVE_PERIOD, DEFAULT_RESOURCE_ID
+
+# 보관 기간이 지난 예약은 학기(또는 연도)별 SQLite 파일로 옮기고, 현재 DB의 archives 테이블에 목록을 남긴다.
+# 지난 날짜 범위를 조회할 때만 해당 파일을 ATTACH해서 읽으므로 현재 DB는 작게 유지된다.
+
+ARCHIVE_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS archive.reservations (
+        id INTEGER PRIMARY KEY,
+        student_id TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        start_min INTEGER NOT NULL,
+        end_min INTEGER NOT NULL,
+        resource_id INTEGER NOT NULL DEFAULT {DEFAULT_RESOURCE_ID}
+    )
+'''
+ARCHIVE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS archive.idx_reservations_day_time ON reservations(day, start_min, end_min)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_reservations_resource_day_time ON reservations(resource_id, day, start_min, end_min)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_reservations_student_id ON reservations(student_id)',
+]
+
+
+_written = set()  # 업로드해야 하는 (이번 프로세스에서 행을 옮겨 넣은) 보관 단위 이름
+_written_lock = threading.Lock()
+
+
+def term_of(day):
+    # 날짜 번호가 속한 보관 단위의 (이름, 첫날, 마지막 날)
+    d = from_day(day)
+    if ARCHIVE_PERIOD == 'year':
+        return str(d.year), to_day(date(d.year, 1, 1)), to_day(date(d.year, 12, 31))
+    if d.month <= 6:
+        return f"{d.year}-1", to_day(date(d.year, 1, 1)), to_day(date(d.year, 6, 30))
+    return f"{d.year}-2", to_day(date(d.year, 7, 1)), to_day(date(d.year, 12, 31))
+
+
+def archive_file(name):
+    return os.path.join(ARCHIVE_DIR, f"reservations_{name}.db")
+
+
+def remote_path(name):
+    # GitHub에 올라가는 압축 보관 파일 경로
+    return f"{ARCHIVE_DIR}/reservations_{name}.db.gz"
+
+
+def horizon(today=None):
+    # 이 날짜 번호보다 앞선 예약은 보관 대상
+    return to_day(today or date.today()) - ARCHIVE_RETENTION_DAYS
+
+
+def _ensure_local(name):
+    # 보관 파일이 없으면 (새로 배포된 경우 등) GitHub에서 받아 온다
+    path = archive_file(name)
+    if not os.path.exists(path):
+        from persistence import download_snapshot
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        download_snapshot(path, remote_path(name))
+    return path
+
+
+def _upgrade(conn):
+    # 예약 대상이 생기기 전에 만든 보관 파일은 모두 기본 대상의 예약이다
+    columns = [row[1] for row in conn.execute('PRAGMA archive.table_info(reservations)')]
+    if columns and 'resource_id' not in columns:
+        conn.execute(f'ALTER TABLE archive.reservations ADD COLUMN resource_id INTEGER NOT NULL DEFAULT {DEFAULT_RESOURCE_ID}')
+        conn.execute(ARCHIVE_INDEXES[1])
+        conn.commit()
+
+
+def sources(conn, start_day=None, end_day=None):
+    # get_reservations가 읽을 스키마 이름을 날짜 순으로 돌려준다. 보관 파일은 읽는 동안만 ATTACH되어 있다.
+    # 보관 단위는 날짜 범위가 겹치지 않으므로 차례로 읽으면 (day, start_min, end_min, id) 순서가 유지된다
+    conditions = []
+    params = []
+    if start_day is not None:
+        conditions.append("last_day >= ?")
+        params.append(start_day)
+    if end_day is not None:
+        conditions.append("first_day <= ?")
+        params.append(end_day)
+    query = f"SELECT name FROM archives {'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY first_day"
+    names = [row[0] for row in conn.execute(query, params).fetchall()]
+    for name in names:
+        conn.execute("ATTACH DATABASE ? AS archive", (_ensure_local(name),))
+        try:
+            _upgrade(conn)
+            yield 'archive'
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    yield 'main'
+
+
+def _move(conn, name, first_day, last_day, start_day, end_day):
+    # start_day ~ end_day 예약을 보관 파일 하나로 옮긴다. 옮긴 id 목록을 돌려준다.
+    # WAL 모드에서는 두 파일의 커밋이 함께 원자적이지 않지만, INSERT OR REPLACE 후 DELETE 하므로 다시 실행하면 정리된다
+    # 이미 있는 보관 단위는 먼저 GitHub에서 받아 와 그 파일에 덧붙인다 (새 파일로 덮어 올리면 기존 행이 사라진다)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    if conn.execute("SELECT 1 FROM main.archives WHERE name = ?", (name,)).fetchone():
+        path = _ensure_local(name)
+    else:
+        path = archive_file(name)
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        _upgrade(conn)
+        conn.execute(ARCHIVE_SCHEMA)
+        for statement in ARCHIVE_INDEXES:
+            conn.execute(statement)
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM main.reservations WHERE day BETWEEN ? AND ?", (start_day, end_day))]
+            conn.execute("""
+                INSERT OR REPLACE INTO archive.reservations (id, student_id, resource_id, day, start_min, end_min)
+                SELECT id, student_id, resource_id, day, start_min, end_min FROM main.reservations WHERE day BETWEEN ? AND ?
+            """, (start_day, end_day))
+            conn.execute("DELETE FROM main.reservations WHERE day BETWEEN ? AND ?", (start_day, end_day))
+            conn.execute("""
+                INSERT INTO main.archives (name, first_day, last_day, row_count)
+                VALUES (?, ?, ?, (SELECT COUNT(*) FROM archive.reservations))
+                ON CONFLICT(name) DO UPDATE SET row_count = excluded.row_count
+            """, (name, first_day, last_day))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    with _written_lock:
+        _written.add(name)
+    return ids
+
+
+def take_written():
+    # 마지막으로 부른 뒤 행을 옮겨 넣은 보관 단위 이름 (persistence가 이 파일만 올린다)
+    with _written_lock:
+        names = sorted(_written)
+        _written.clear()
+    return names
+
+
+def archive_reservations(before=None):
+    # before(기본: 오늘 - ARCHIVE_RETENTION_DAYS)보다 앞선 예약을 보관 파일로 옮긴다. 반환: {보관 단위 이름: 옮긴 행 수}
+    cutoff = horizon() if before is None else to_day(before)
+    moved = {}
+    removed = []
+    with database.connection() as conn:
+        first, last = conn.execute("SELECT MIN(day), MAX(day) FROM reservations WHERE day < ?", (cutoff,)).fetchone()
+        day = first
+        while day is not None and day <= last:
+            name, first_day, last_day = term_of(day)
+            end_day = min(last_day, cutoff - 1)
+            if conn.execute("SELECT 1 FROM reservations WHERE day BETWEEN ? AND ? LIMIT 1", (day, end_day)).fetchone():
+                ids = _move(conn, name, first_day, last_day, day, end_day)
+                moved[name] = len(ids)
+                removed.extend(ids)
+            day = last_day + 1
+    if moved:
+        database.committed('reservations', 'archives')
+        for reservation_id in removed:
+            database.unindex_reservation(reservation_id)
+    return moved
+
+
+def compact():
+    # 빈 페이지를 회수하고 통계를 갱신한 뒤 WAL을 본 파일에 반영한다 (WAL 모드의 VACUUM 결과는 체크포인트 후에 파일 크기에 반영된다)
+    with database.connection() as conn:
+        conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(database.DATABASE_FILE)
+
+
+def archive_names():
+    with database.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM archives ORDER BY first_day").fetchall()]
+
+
+if __name__ == '__main__':
+    # 사용법: python archive.py [YYYY-MM-DD]  (지정한 날짜 이전 예약을 보관하고 DB를 정리)
+    database.init_db()
+    moved = archive_reservations(sys.argv[1] if len(sys.argv) > 1 else None)
+    for name, count in moved.items():
+        print(f"{archive_file(name)}: {count} reservations")
+    print(f"{database.DATABASE_FILE}: {compact()} bytes")
@@ -1,9 +1,112 @@
 # auth.py
 
 import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from config import AUTH_HASH_ITERATIONS, SESSION_TTL_SECONDS, SESSION_MAX_ENTRIES
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+# 비밀번호 저장 형식: pbkdf2_sha256$반복 횟수$salt(hex)$hash(hex)
+HASH_PREFIX = 'pbkdf2_sha256'
+
+
+def hash_password(password, iterations=AUTH_HASH_ITERATIONS):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"{HASH_PREFIX}${iterations}${salt.hex()}${digest.hex()}"
+
+def hash_passwords(passwords):
+    # 여러 비밀번호를 한 번에 해시 (pbkdf2_hmac은 GIL을 놓으므로 스레드로 나눠 계산한다)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor() as pool:
+        return list(pool.map(hash_password, passwords))
+
+def is_hashed(stored_password):
+    return stored_password.startswith(HASH_PREFIX + '$')
 
 def verify_password(stored_password, provided_password):
-    return stored_password == hashlib.sha256(provided_password.encode()).hexdigest()
\ No newline at end of file
+    if not is_hashed(stored_password):
+        return False
+    _, iterations, salt, digest = stored_password.split('$')
+    candidate = hashlib.pbkdf2_hmac('sha256', provided_password.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(candidate.hex(), digest)
+
+_dummy_hash = None
+
+
+def dummy_hash():
+    # 없는 학번으로 로그인할 때도 같은 시간이 걸리도록 대신 검증할 해시 (처음 쓸 때 한 번 만든다)
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    return _dummy_hash
+
+
+class SessionStore:
+    # 로그인 세션. 사용자 정보는 서버 메모리의 LRU(최대 max_entries개, 발급 후 ttl초까지)에 두고
+    # 브라우저에는 서명된 토큰만 남겨서, 다시 연결된 세션은 DB 조회나 비밀번호 확인 없이 이어진다.
+    # 서명 키는 프로세스마다 새로 만들므로 재시작하면 다시 로그인해야 한다
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._secret = secrets.token_bytes(32)
+        self._entries = OrderedDict()  # 토큰 id -> (만료 시각, 사용자)
+        self._lock = threading.Lock()
+
+    def _sign(self, token_id):
+        return hmac.new(self._secret, token_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _token_id(self, token):
+        # 문자열이 아니거나 서명이 맞지 않는 토큰은 저장소를 보지 않고 거절
+        if not isinstance(token, str):
+            return None
+        token_id, _, signature = token.partition('.')
+        if not token_id or not hmac.compare_digest(signature, self._sign(token_id)):
+            return None
+        return token_id
+
+    def issue(self, user):
+        token_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[token_id] = (self.clock() + self.ttl, user)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return f"{token_id}.{self._sign(token_id)}"
+
+    def resume(self, token):
+        # 유효한 토큰이면 로그인할 때 저장한 사용자, 아니면 None
+        token_id = self._token_id(token)
+        if token_id is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(token_id)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[token_id]
+                return None
+            self._entries.move_to_end(token_id)
+            return entry[1]
+
+    def update(self, token, user):
+        # 개인정보 수정 후 세션에 저장된 사용자 정보를 바꾼다 (만료 시각은 그대로)
+        token_id = self._token_id(token)
+        with self._lock:
+            if token_id in self._entries:
+                self._entries[token_id] = (self._entries[token_id][0], user)
+
+    def revoke(self, token):
+        token_id = self._token_id(token)
+        with self._lock:
+            self._entries.pop(token_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 프로세스 전체에서 공유하는 세션 저장소
+sessions = SessionStore()
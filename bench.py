@@ -0,0 +1,312 @@
+# bench.py
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import archive
+import auth
+import database
+import writer
+from config import (TEAM_COLORS, DEFAULT_RESOURCE_ID, BENCH_REPEAT, BENCH_PAGE_REPEAT, BENCH_REGRESSION_THRESHOLD,
+                    BENCH_NOISE_FLOOR_MS)
+from occupancy import SLOTS_PER_DAY, SLOT_MINUTES
+from timeutil import to_day, from_day, week_bounds
+
+# 시드 고정 합성 데이터로 데이터 계층 함수와 페이지 렌더링 시간을 재고 JSON으로 남긴다.
+# 사용법: python bench.py --reservations 100000 --out bench.json [--baseline old.json] [--pages]
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def generate(path, reservations=10000, users=200, seed=0, per_day=8, end_date=None):
+    # 같은 시드면 항상 같은 DB를 만든다. 유저는 TEAM_COLORS의 팀에 고르게 나누고,
+    # 예약은 서로 겹치지 않도록 하루 최대 per_day건씩 end_date(기본: 4주 뒤)부터 필요한 만큼 과거로 채운다
+    rng = random.Random(seed)
+    per_day = max(1, min(per_day, SLOTS_PER_DAY // 2))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    database.use_database(path)
+    database.init_db()
+
+    teams = list(TEAM_COLORS)
+    hashes = auth.hash_passwords([f"pw{i}" for i in range(users)])
+    user_rows = [(f"{20000000 + i:08d}", f"user{i}", hashes[i], teams[i % len(teams)], TEAM_COLORS[teams[i % len(teams)]])
+                 for i in range(users)]
+    last_day = to_day(end_date or date.today() + timedelta(weeks=4))
+    rows = []
+    remaining = reservations
+    day = last_day - (-(-reservations // per_day)) + 1
+    while remaining > 0:
+        count = min(per_day, remaining)
+        # 하루 48칸의 경계 중 2 * count개를 골라 차례로 짝지으면 겹치지 않는 구간이 된다
+        points = sorted(rng.sample(range(SLOTS_PER_DAY + 1), 2 * count))
+        for start, end in zip(points[::2], points[1::2]):
+            rows.append((user_rows[rng.randrange(users)][0], day, start * SLOT_MINUTES, end * SLOT_MINUTES))
+        remaining -= count
+        day += 1
+
+    with database.connection() as conn, conn:
+        conn.executemany("INSERT INTO users (student_id, name, password, team, team_color) VALUES (?, ?, ?, ?, ?)", user_rows)
+        conn.executemany("INSERT INTO reservations (student_id, day, start_min, end_min) VALUES (?, ?, ?, ?)", rows)
+    with database.connection() as conn:
+        conn.execute('ANALYZE')
+    database.committed('users', 'reservations')
+    return {'reservations': len(rows), 'users': users, 'first_day': str(from_day(rows[0][1])), 'last_day': str(from_day(last_day))}
+
+
+def measure(run, repeat, setup=None, teardown=None):
+    # 한 번 미리 실행한 뒤 repeat번 잰다. setup()의 반환값이 run/teardown의 인자가 된다 (준비/정리 시간은 제외)
+    times = []
+    for i in range(repeat + 1):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        if setup:
+            run(argument)
+        else:
+            run()
+        elapsed = time.perf_counter() - started
+        if teardown:
+            teardown(argument)
+        if i:
+            times.append(elapsed * 1000)
+    times.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(times[0], 3),
+        'median_ms': round(statistics.median(times), 3),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(times), 3),
+    }
+
+
+def _free_day_factory(start_day):
+    # 쓰기 벤치마크용: 아직 예약이 없는 먼 미래의 날짜를 하나씩 돌려준다
+    days = iter(range(start_day, start_day + 10 ** 6))
+    return lambda: next(days)
+
+
+def _remove(ids):
+    writer.modify(database.delete_reservations, ids)
+
+
+def micro_benchmarks(repeat, student_id, rng):
+    # database.py 함수, 예약 가능 시간 계산, 중복 확인, 차트 생성
+    from charts import occupancy_matrix, daily_occupancy_figure
+    today = date.today()
+    team = list(TEAM_COLORS)[0]
+    monday, sunday = week_bounds(to_day(today))
+    free_day = _free_day_factory(to_day(today) + 3650)
+    users = database.get_users.uncached()
+    student_ids = users['student_id'].tolist()
+    counter = iter(range(10 ** 9))
+
+    with database.connection() as conn:
+        busiest = conn.execute("SELECT day FROM reservations GROUP BY day ORDER BY COUNT(*) DESC, day DESC LIMIT 1").fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+    deep_cursor = None
+    page = database.get_reservations.uncached(after=None, limit=max(1, min(total, 5000) - 1), columns=('id',))
+    if len(page):
+        deep_cursor = database.reservation_cursor(page, len(page))
+    day_frame = database.get_reservations.uncached(start_date=busiest, end_date=busiest, columns=('team', 'start_min', 'end_min'))
+    first_page = database.get_reservations.uncached(limit=50)
+
+    def reserve_many_setup():
+        first = free_day()
+        for _ in range(6):
+            free_day()
+        return database.recurring_slots(from_day(first), from_day(first + 6), {0, 2, 4}, '09:00', '10:00')
+
+    def admin_setup():
+        return [database.insert_reservation(student_id, '10:00', '11:00', from_day(free_day())) for _ in range(10)]
+
+    def check_overlap_sql():
+        with database.connection() as conn:
+            conn.execute("""
+                SELECT EXISTS (SELECT 1 FROM reservations WHERE resource_id = ? AND day = ? AND start_min < ? AND end_min > ?)
+            """, (DEFAULT_RESOURCE_ID, busiest, 20 * 60, 18 * 60)).fetchone()
+
+    # 다시 연결된 세션이 로그인 없이 이어지는 경로 (DB를 읽지 않는다)
+    token = auth.sessions.issue(database.User(0, student_id, "bench", team, TEAM_COLORS[team]))
+
+    cases = {
+        'get_connection': dict(run=lambda: database.get_connection().close()),
+        'data_version': dict(run=database.data_version),
+        'add_user': dict(run=lambda: database.add_user(f"b{next(counter):07d}", "bench", "pw", team, TEAM_COLORS[team])),
+        'check_user': dict(run=lambda: database.check_user(student_ids[rng.randrange(len(student_ids))], "wrong")),
+        'session_resume': dict(run=lambda: auth.sessions.resume(token)),
+        'update_team_color': dict(run=lambda: database.update_team_color(team, TEAM_COLORS[team])),
+        'update_user': dict(run=lambda: database.update_user(users.iloc[0]['student_id'], users.iloc[0]['name'], users.iloc[0]['team'],
+                                                              users.iloc[0]['student_id'], users.iloc[0]['team_color'])),
+        'get_users.page': dict(run=lambda: database.get_users.uncached(limit=50)),
+        'get_users.search': dict(run=lambda: database.get_users.uncached(search='user1', limit=50)),
+        'get_users.cached': dict(run=lambda: database.get_users(limit=50)),
+        'user_cursor': dict(run=lambda: database.user_cursor(users, 50)),
+        'recurring_slots': dict(run=lambda: database.recurring_slots(today, today + timedelta(weeks=16), {0, 2, 4}, '18:00', '20:00')),
+        'insert_reservation': dict(setup=lambda: from_day(free_day()),
+                                   run=lambda d: _ids.append(database.insert_reservation(student_id, '10:00', '11:00', d)),
+                                   teardown=lambda _: _remove([_ids.pop()])),
+        'writer.reserve': dict(setup=lambda: from_day(free_day()),
+                               run=lambda d: _ids.append(writer.reserve(student_id, '10:00', '11:00', d).reservation_id),
+                               teardown=lambda _: _remove([_ids.pop()])),
+        'book_slots': dict(setup=reserve_many_setup,
+                           run=lambda slots: _ids.extend(r.reservation_id for r in writer.reserve_many(student_id, slots)),
+                           teardown=lambda _: _remove([_ids.pop() for _ in range(len(_ids))])),
+        'overlap_check.sql': dict(run=check_overlap_sql),
+        'overlap_check.index': dict(run=lambda: database.get_occupancy().is_free(busiest, '18:00', '20:00')),
+        'get_reserved_time': dict(run=lambda: database.get_occupancy().team_hours(team, monday, sunday)),
+        'get_reservations.day': dict(run=lambda: database.get_reservations.uncached(start_date=busiest, end_date=busiest)),
+        'get_reservations.resource_day': dict(run=lambda: database.get_reservations.uncached(start_date=busiest, end_date=busiest,
+                                                                                          resource_id=DEFAULT_RESOURCE_ID)),
+        'get_reservations.week': dict(run=lambda: database.get_reservations.uncached(start_date=from_day(monday), end_date=from_day(sunday))),
+        'get_reservations.first_page': dict(run=lambda: database.get_reservations.uncached(limit=50)),
+        'get_reservations.deep_page': dict(run=lambda: database.get_reservations.uncached(after=deep_cursor, limit=50)),
+        'get_reservations.student': dict(run=lambda: database.get_reservations.uncached(student_id=student_id, limit=50)),
+        'get_reservations.team_month': dict(run=lambda: database.get_reservations.uncached(start_date=today, end_date=today + timedelta(days=30), team=team)),
+        'get_reservations.history': dict(run=lambda: database.get_reservations.uncached(start_date=today - timedelta(days=2 * 365), limit=50)),
+        'get_reservations.cached': dict(run=lambda: database.get_reservations(start_date=busiest, end_date=busiest)),
+        'reservation_cursor': dict(run=lambda: database.reservation_cursor(first_page, 50)),
+        'rebuild_occupancy': dict(run=database.rebuild_occupancy),
+        'get_occupancy': dict(run=database.get_occupancy),
+        'find_free_windows': dict(run=lambda: database.find_free_windows(team, today, today + timedelta(days=180), 2, 10)),
+        'shift_reservations': dict(setup=admin_setup, run=lambda ids: writer.modify(database.shift_reservations, ids, 30), teardown=_remove),
+        'reassign_reservations': dict(setup=admin_setup, run=lambda ids: writer.modify(database.reassign_reservations, ids, student_ids[-1]), teardown=_remove),
+        'edit_reservations': dict(setup=admin_setup,
+                                  run=lambda ids: writer.modify(database.edit_reservations, [(i, from_day(free_day()), '12:00', '13:00') for i in ids]),
+                                  teardown=_remove),
+        'delete_reservations': dict(setup=admin_setup, run=_remove),
+        'occupancy_matrix': dict(run=lambda: occupancy_matrix(day_frame, list(TEAM_COLORS))),
+        'daily_occupancy_figure': dict(run=lambda: daily_occupancy_figure(day_frame, "bench", TEAM_COLORS)),
+    }
+    _ids = []
+    results = {}
+    for name, case in cases.items():
+        results[name] = measure(case['run'], repeat, case.get('setup'), case.get('teardown'))
+    return results
+
+
+def page_benchmarks(repeat, student_id, app_file=APP_FILE):
+    # AppTest로 각 화면의 전체 렌더링 시간을 잰다. 사이드바 메뉴(컴포넌트)는 AppTest에서 고를 수 없으므로 선택값을 고정한다
+    from streamlit.testing.v1 import AppTest
+    import streamlit_option_menu
+    user = database.get_users.uncached(search=student_id, limit=1).iloc[0]
+    pages = {'login_page': None, 'main_page': "예약", 'my_page': "마이 페이지", 'admin_page': "관리자 페이지"}
+    original = streamlit_option_menu.option_menu
+    results = {}
+    try:
+        for name, menu in pages.items():
+            streamlit_option_menu.option_menu = lambda *args, menu=menu, **kwargs: menu
+            times = []
+            exceptions = []
+            for i in range(repeat + 1):
+                app = AppTest.from_file(app_file, default_timeout=300)
+                if menu is not None:
+                    app.session_state['logged_in'] = True
+                    app.session_state['is_admin'] = True
+                    app.session_state['student_id'] = user['student_id']
+                    app.session_state['user_name'] = user['name']
+                    app.session_state['team'] = user['team']
+                    app.session_state['team_color'] = user['team_color']
+                started = time.perf_counter()
+                app.run()
+                elapsed = time.perf_counter() - started
+                exceptions.extend(str(e.value) for e in app.exception)
+                if i:
+                    times.append(elapsed * 1000)
+            results[name] = {
+                'repeat': repeat,
+                'min_ms': round(min(times), 1),
+                'median_ms': round(statistics.median(times), 1),
+                'exceptions': sorted(set(exceptions)),
+            }
+    finally:
+        streamlit_option_menu.option_menu = original
+    return results
+
+
+def compare(report, baseline, threshold=BENCH_REGRESSION_THRESHOLD, floor=BENCH_NOISE_FLOOR_MS):
+    # 기준 결과보다 중앙값이 threshold 비율 이상, floor(ms) 이상 느려진 항목
+    regressions = []
+    for section in ('micro', 'pages'):
+        for name, result in report.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if old is None:
+                continue
+            if result['median_ms'] > old['median_ms'] * (1 + threshold) and result['median_ms'] - old['median_ms'] > floor:
+                regressions.append({'name': f"{section}.{name}", 'baseline_ms': old['median_ms'], 'median_ms': result['median_ms'],
+                                    'ratio': round(result['median_ms'] / old['median_ms'], 2) if old['median_ms'] else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data layer and pages on a seeded synthetic database.")
+    parser.add_argument('--reservations', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--per-day', type=int, default=8, help="reservations per day (at most 24); more reservations span more years")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT)
+    parser.add_argument('--pages', action='store_true', help="also time full page renders with AppTest")
+    parser.add_argument('--page-repeat', type=int, default=BENCH_PAGE_REPEAT)
+    parser.add_argument('--no-archive', action='store_true', help="keep all history in the live database")
+    parser.add_argument('--workdir', help="directory for the generated database (default: a new temporary directory)")
+    parser.add_argument('--out', help="write the JSON report here (default: stdout)")
+    parser.add_argument('--baseline', help="JSON report to compare against; exit 1 on regression")
+    parser.add_argument('--threshold', type=float, default=BENCH_REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    # 보관 파일과 지표 파일은 현재 디렉터리 기준이므로 작업 디렉터리에서 실행한다
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix='lab-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    started = time.perf_counter()
+    data = generate(os.path.join(workdir, 'reservation.db'), args.reservations, args.users, args.seed, args.per_day)
+    data['generate_s'] = round(time.perf_counter() - started, 2)
+    if not args.no_archive:
+        # 앱이 시작할 때와 같은 상태(보관 기간이 지난 예약은 보관 파일)로 잰다
+        started = time.perf_counter()
+        moved = archive.archive_reservations()
+        data['archived'] = {'terms': len(moved), 'reservations': sum(moved.values())}
+        archive.compact()
+        data['archive_s'] = round(time.perf_counter() - started, 2)
+    data['db_bytes'] = os.path.getsize(database.DATABASE_FILE)
+
+    student_id = f"{20000000:08d}"
+    report = {
+        'meta': {
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'workdir': workdir,
+            'data': data,
+        },
+        'micro': micro_benchmarks(args.repeat, student_id, random.Random(args.seed)),
+    }
+    if args.pages:
+        report['pages'] = page_benchmarks(args.page_repeat, student_id)
+    if baseline_path:
+        with open(baseline_path) as f:
+            report['regressions'] = compare(report, json.load(f), args.threshold)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# bootstrap.py
+
+import json
+import os
+import sys
+import threading
+import time
+import database
+from config import STARTUP_IMPORT_BUDGET_MS, STARTUP_FIRST_RENDER_BUDGET_MS
+
+# 프로세스 시작 후 주요 시점(초). 각 이름은 처음 한 번만 기록된다
+PROCESS_START = time.perf_counter()
+timeline = {}
+
+# 로그인 페이지를 그릴 때까지 불러오면 안 되는 무거운 모듈
+DEFERRED_MODULES = ['plotly', 'github', 'requests', 'pytz']
+
+_state = 'pending'
+error = None
+maintenance = None  # 시작 후 보관 작업 결과 ({보관 단위: 옮긴 행 수}) 또는 예외
+_ready = threading.Event()
+_thread = None
+_lock = threading.Lock()
+
+
+def mark(name):
+    timeline.setdefault(name, time.perf_counter() - PROCESS_START)
+
+
+def _run():
+    global _state, error
+    try:
+        if not os.path.exists(database.DATABASE_FILE):
+            _state = 'downloading'
+            try:
+                from persistence import download_snapshot
+                download_snapshot(database.DATABASE_FILE)
+            except Exception as e:
+                # 다운로드에 실패하면 빈 데이터베이스를 새로 만든다
+                error = e
+        _state = 'migrating'
+        database.init_db()
+        _state = 'ready'
+    except Exception as e:
+        error = e
+        _state = 'failed'
+    finally:
+        mark('db_ready')
+        _ready.set()
+    if _state == 'ready':
+        _maintain()
+
+
+def _maintain():
+    # 보관 기간이 지난 예약을 보관 파일로 옮기고, 옮긴 것이 있으면 DB를 정리한다 (첫 화면을 막지 않도록 준비 후 실행)
+    global maintenance
+    try:
+        import archive
+        maintenance = archive.archive_reservations()
+        if maintenance:
+            archive.compact()
+    except Exception as e:
+        maintenance = e
+
+
+def start():
+    # 프로세스당 한 번 백그라운드에서 DB 다운로드/마이그레이션을 시작
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name='db-bootstrap', daemon=True)
+            _thread.start()
+
+
+def state():
+    return _state
+
+
+def wait(timeout=None):
+    # 준비가 끝났으면 True
+    return _ready.wait(timeout) and _state == 'ready'
+
+
+def measure(app_file):
+    # 새 프로세스에서 호출: 앱의 첫 화면(로그인 페이지)을 그리는 데 걸린 시간과 import 시간을 잰다
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import = time.perf_counter() - started
+    preloaded = set(sys.modules)  # streamlit 자체가 미리 불러오는 모듈은 제외
+    app = AppTest.from_file(app_file, default_timeout=60)
+    app.run()
+    first_render = time.perf_counter() - started
+    app_timeline = sys.modules['bootstrap'].timeline if 'bootstrap' in sys.modules else timeline
+    imports = app_timeline.get('imports_done', 0) - app_timeline.get('script_start', 0)
+    return {
+        'streamlit_import_ms': round(streamlit_import * 1000, 1),
+        'app_import_ms': round(imports * 1000, 1),
+        'first_render_ms': round(first_render * 1000, 1),
+        'timeline_ms': {name: round(value * 1000, 1) for name, value in app_timeline.items()},
+        'deferred_modules_loaded': [m for m in DEFERRED_MODULES if m in sys.modules and m not in preloaded],
+        'exceptions': [str(e.value) for e in app.exception],
+    }
+
+
+def check_budget(report):
+    # 예산을 넘긴 항목 목록 (비어 있으면 통과)
+    problems = []
+    if report['app_import_ms'] > STARTUP_IMPORT_BUDGET_MS:
+        problems.append(f"app imports took {report['app_import_ms']}ms (budget {STARTUP_IMPORT_BUDGET_MS}ms)")
+    if report['first_render_ms'] > STARTUP_FIRST_RENDER_BUDGET_MS:
+        problems.append(f"first render took {report['first_render_ms']}ms (budget {STARTUP_FIRST_RENDER_BUDGET_MS}ms)")
+    if report['deferred_modules_loaded']:
+        problems.append(f"deferred modules loaded on cold start: {report['deferred_modules_loaded']}")
+    if report['exceptions']:
+        problems.append(f"app raised: {report['exceptions']}")
+    return problems
+
+
+if __name__ == '__main__':
+    # 사용법: python bootstrap.py [app.py]  (콜드 스타트 리포트를 JSON으로 출력, 예산 초과 시 종료 코드 1)
+    app_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    report = measure(app_file)
+    report['budget_problems'] = check_budget(report)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if report['budget_problems'] else 0)
@@ -0,0 +1,106 @@
+# cache.py
+
+import threading
+from collections import OrderedDict
+from functools import wraps
+from config import CACHE_MAX_ENTRIES
+
+# 모든 세션이 공유하는 조회 결과 캐시.
+# 키에는 조회 함수가 의존하는 테이블들의 쓰기 세대(generation)가 포함되어 있어
+# 쓰기 후 invalidate()로 세대를 올리면 해당 테이블을 읽는 항목만 무효화된다.
+# 다른 프로세스의 커밋은 version source(PRAGMA data_version)로 감지해 전체를 무효화한다.
+
+_lock = threading.RLock()
+_entries = OrderedDict()
+_generations = {}
+_epoch = 0  # 외부 변경 감지 시 증가 (모든 항목 무효화)
+_version_source = None
+_seen_version = None
+_change_listeners = []
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def set_version_source(source):
+    # source(): DB 변경 카운터를 돌려주는 함수 (외부 커밋 감지용)
+    global _version_source, _seen_version
+    with _lock:
+        _version_source = source
+        _seen_version = None
+
+
+def on_external_change(listener):
+    # 외부 커밋이 감지되었을 때 호출할 함수 등록 (예: 점유 인덱스 재생성)
+    _change_listeners.append(listener)
+
+
+def invalidate(*tables):
+    # 로컬 쓰기 직후 호출. 해당 테이블에 의존하는 항목만 무효화
+    global _seen_version
+    with _lock:
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+        # 방금 커밋한 변경은 외부 변경으로 보지 않도록 현재 카운터를 기록
+        if _version_source is not None:
+            _seen_version = _version_source()
+
+
+def clear():
+    global _seen_version, _epoch
+    with _lock:
+        _entries.clear()
+        _epoch += 1
+        _seen_version = None
+
+
+def _check_external_change():
+    global _seen_version, _epoch
+    if _version_source is None:
+        return
+    version = _version_source()
+    if _seen_version is None:
+        _seen_version = version
+    elif version != _seen_version:
+        _seen_version = version
+        _entries.clear()
+        _epoch += 1
+        for listener in _change_listeners:
+            listener()
+
+
+def _generation(tables):
+    return (_epoch,) + tuple(_generations.get(table, 0) for table in tables)
+
+
+def version(*tables):
+    # 해당 테이블의 현재 세대. 다른 프로세스의 커밋도 반영되므로 응답 ETag 등에 쓸 수 있다
+    with _lock:
+        _check_external_change()
+        return _generation(tables)
+
+
+def cached(*tables):
+    # 결과를 테이블 세대 기준으로 캐시하는 데코레이터. 반환값은 공유되므로 호출하는 쪽에서 수정하면 안 된다
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _lock:
+                _check_external_change()
+                key = (func.__name__, args, tuple(sorted(kwargs.items())), _generation(tables))
+                if key in _entries:
+                    _entries.move_to_end(key)
+                    stats['hits'] += 1
+                    return _entries[key]
+            stats['misses'] += 1
+            value = func(*args, **kwargs)
+            with _lock:
+                # 조회 중에 쓰기가 있었다면 세대가 바뀌었으므로 오래된 결과를 저장하지 않는다
+                if key[-1] == _generation(tables):
+                    _entries[key] = value
+                    _entries.move_to_end(key)
+                    while len(_entries) > CACHE_MAX_ENTRIES:
+                        _entries.popitem(last=False)
+                        stats['evictions'] += 1
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
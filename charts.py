@@ -0,0 +1,108 @@
+# charts.py
+
+import numpy as np
+import pandas as pd
+from metrics import instrument
+from occupancy import SLOT_MINUTES
+from timeutil import MINUTES_PER_DAY, format_minutes
+
+
+def slot_labels(slot_minutes=SLOT_MINUTES):
+    return [format_minutes(m) for m in range(0, MINUTES_PER_DAY, slot_minutes)]
+
+
+def occupancy_matrix(reservations, teams=None, slot_minutes=SLOT_MINUTES):
+    # team, start_min, end_min 컬럼을 가진 하루치 예약으로 팀 × 슬롯 점유 행렬(bool)을 만든다.
+    # 반환: (팀 목록, 행렬[len(teams), 하루 슬롯 수])
+    n_slots = MINUTES_PER_DAY // slot_minutes
+    team_values = reservations['team'].fillna('')
+    if teams is None:
+        teams = list(dict.fromkeys(team_values))
+    matrix = np.zeros((len(teams), n_slots), dtype=bool)
+    if reservations.empty or not teams:
+        return teams, matrix
+
+    start = reservations['start_min'].to_numpy()
+    end = reservations['end_min'].to_numpy()
+    first = start // slot_minutes
+    last = -(-end // slot_minutes)
+
+    slots = np.arange(n_slots)
+    covered = (slots >= first[:, None]) & (slots < last[:, None])  # 예약 × 슬롯
+    codes = pd.Categorical(team_values, categories=teams).codes
+    known = codes >= 0
+    np.logical_or.at(matrix, codes[known], covered[known])
+    return teams, matrix
+
+
+@instrument('figure.daily_occupancy')
+def daily_occupancy_figure(reservations, title, team_colors, slot_minutes=SLOT_MINUTES):
+    # 팀별 예약 현황 누적 막대 그래프. 팀마다 trace 하나, 막대 높이는 점유 여부(0/1)
+    import plotly.graph_objects as go
+
+    present = set(reservations['team'].fillna(''))
+    teams = [team for team in team_colors if team in present] + sorted(present - set(team_colors))
+    teams, matrix = occupancy_matrix(reservations, teams, slot_minutes)
+    labels = slot_labels(slot_minutes)
+
+    fig = go.Figure()
+    for team, row in zip(teams, matrix):
+        fig.add_trace(go.Bar(
+            x=labels,
+            y=row.astype(int),
+            name=team,
+            marker=dict(color=team_colors.get(team, 'gray')),
+            showlegend=team != '',  # 팀이 없는 예약은 레전드 표시 안 함
+        ))
+    if not teams:
+        # 예약이 없어도 00시부터 24시까지 축을 보여준다
+        fig.add_trace(go.Bar(x=labels, y=np.zeros(len(labels), dtype=int), showlegend=False))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="예약 시간",
+        yaxis_title=" ",
+        yaxis=dict(tickvals=[1], ticktext=['1']),
+        barmode='stack',
+        xaxis=dict(type='category', categoryorder='array', categoryarray=labels),
+    )
+    return fig
+
+
+@instrument('figure.resource_occupancy')
+def resource_occupancy_figure(reservations, resources, title, team_colors):
+    # 예약 대상별 하루 예약 타임라인. resource, team, start_min, end_min 컬럼을 가진 하루치 예약(조회 한 번)으로 그리며
+    # 팀마다 trace 하나에 예약마다 막대 하나이므로 비용은 대상 수가 아니라 예약 수에 비례한다
+    import plotly.graph_objects as go
+
+    team_values = reservations['team'].fillna('')
+    present = set(team_values)
+    teams = [team for team in team_colors if team in present] + sorted(present - set(team_colors))
+    start = reservations['start_min'].to_numpy() / 60
+    duration = reservations['end_min'].to_numpy() / 60 - start
+
+    fig = go.Figure()
+    for team in teams:
+        rows = (team_values == team).to_numpy()
+        fig.add_trace(go.Bar(
+            y=reservations['resource'][rows],
+            x=duration[rows],
+            base=start[rows],
+            orientation='h',
+            name=team,
+            marker=dict(color=team_colors.get(team, 'gray')),
+            showlegend=team != '',
+            hovertext=[f"{format_minutes(s)} ~ {format_minutes(e)}"
+                       for s, e in zip(reservations['start_min'][rows], reservations['end_min'][rows])],
+        ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="예약 시간",
+        xaxis=dict(range=[0, 24], tickvals=list(range(0, 25, 2)), ticktext=[f"{h:02d}:00" for h in range(0, 25, 2)]),
+        # 예약이 없는 대상도 한 줄씩 보여준다
+        yaxis=dict(type='category', categoryorder='array', categoryarray=list(resources), range=[-0.5, len(resources) - 0.5]),
+        barmode='overlay',
+        height=120 + 40 * len(resources),
+    )
+    return fig
@@ -6,3 +6,80 @@ ACCENT_COLOR = "#6AB29B"
 BACKGROUND_COLOR = "#E4D5C7"
 TEXT_COLOR = "#95877A"
 DATABASE_FILE = 'reservation.db'
+
+# 팀별 기본 색상
+TEAM_COLORS = {
+    "CAD_UAV": "#FF5733",
+    "Palletrone": "#33FF57",
+    "Ja!warm": "#3357FF",
+    "Crazyflie": "#FF33A8"
+}
+
+# 데이터베이스 커넥션 설정
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE = 64 * 1024 * 1024
+DB_STATEMENT_CACHE_SIZE = 128
+
+
+# 예약 정책
+WEEKLY_QUOTA_HOURS = 24  # 팀별 주간 예약 가능 시간 (예약 대상마다 따로 센다)
+
+# 예약 대상 (실험실, 장비). 처음 마이그레이션할 때 이 순서로 등록되며 기존 예약은 첫 번째 대상으로 옮겨진다
+RESOURCES = ["실험실", "비행 아레나", "모션 캡처"]
+DEFAULT_RESOURCE_ID = 1
+
+# 로그인 (auth.py)
+AUTH_HASH_ITERATIONS = 100000  # 비밀번호 PBKDF2 반복 횟수 (저장된 해시마다 기록되므로 바꿔도 기존 비밀번호는 그대로 검증된다)
+SESSION_TTL_SECONDS = 12 * 60 * 60  # 로그인 후 다시 연결해도 이어지는 시간
+SESSION_MAX_ENTRIES = 1024  # 서버에 보관하는 세션 수 (넘으면 가장 오래 쓰지 않은 세션부터 버린다)
+SESSION_COOKIE_NAME = "lab_session"  # 세션 토큰을 담는 쿠키 (URL에는 토큰을 남기지 않는다)
+
+# 예약 쓰기 스레드 (group commit)
+WRITER_BATCH_SIZE = 64
+WRITER_BATCH_WINDOW_MS = 5
+
+# 조회 캐시
+CACHE_MAX_ENTRIES = 256
+
+# 예약 목록 페이지 크기
+RESERVATION_PAGE_SIZE = 50
+
+# 성능 지표 (metrics.py)
+METRICS_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+METRICS_SLOW_QUERY_MS = 100  # 이보다 오래 걸린 쿼리는 실행 계획과 함께 기록
+METRICS_SLOW_LOG_SIZE = 50
+METRICS_FILE = 'metrics.prom'  # Prometheus textfile 형식
+METRICS_EXPORT_INTERVAL_SECONDS = 15
+
+# 벤치마크 (python bench.py)
+BENCH_REPEAT = 20  # 함수별 반복 횟수
+BENCH_PAGE_REPEAT = 3  # 페이지별 AppTest 실행 횟수
+BENCH_REGRESSION_THRESHOLD = 0.25  # 기준 결과보다 중앙값이 25% 넘게 느려지면 실패
+BENCH_NOISE_FLOOR_MS = 0.5  # 이보다 작은 차이는 회귀로 보지 않는다
+
+# 내보내기/가져오기 (transfer.py)
+EXPORT_CHUNK_SIZE = 5000  # 한 번에 읽고 쓰는 행 수
+
+# 읽기 전용 예약 현황 API (python api.py)
+API_HOST = '127.0.0.1'
+API_PORT = 8502
+API_MAX_AGE_SECONDS = 5  # 클라이언트가 이 시간 동안은 다시 묻지 않아도 된다
+
+# 지난 예약 보관 (python archive.py 로도 실행 가능)
+ARCHIVE_DIR = 'archive'
+ARCHIVE_RETENTION_DAYS = 180  # 이보다 오래된 예약은 보관 파일로 옮긴다 (주간 할당량 계산을 위해 7일 이상)
+ARCHIVE_PERIOD = 'term'  # 'term': 학기별 파일(1~6월, 7~12월), 'year': 연도별 파일
+
+# GitHub 스냅샷 백업
+GITHUB_REPO_NAME = "kamgaa/lab_reservation"
+GITHUB_BRANCH = "main"
+GITHUB_SNAPSHOT_PATH = "reservation.db.gz"
+PERSIST_DELAY_SECONDS = 30  # 이 시간 동안의 쓰기를 모아 한 번에 업로드
+PERSIST_MAX_RETRIES = 5
+PERSIST_BACKOFF_SECONDS = 2
+
+# 콜드 스타트 예산 (python bootstrap.py 로 측정)
+STARTUP_IMPORT_BUDGET_MS = 1500
+STARTUP_FIRST_RENDER_BUDGET_MS = 5000
@@ -1,16 +1,145 @@
+import logging
 import sqlite3
-import pandas as pd
-from config import DATABASE_FILE
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+import auth
+import cache
+import metrics
+from cache import cached
+from metrics import instrument
+from occupancy import OccupancyIndex, SLOT_MINUTES
+from timeutil import MINUTES_PER_DAY, to_day, from_day, to_minutes, to_end_minutes, sql_date, sql_time
+from config import WEEKLY_QUOTA_HOURS, RESOURCES, DEFAULT_RESOURCE_ID, DATABASE_FILE, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE_SIZE, EXPORT_CHUNK_SIZE
+
+log = logging.getLogger(__name__)
+
+# 커넥션 풀 (세션/스레드 간 공유)
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_pool_lock = threading.Lock()
+
+# 날짜별 예약 점유 비트마스크 인덱스 (프로세스 전체 공유)
+_occupancy = OccupancyIndex()
+_rebuild_lock = threading.Lock()
+
+# 외부 커밋 감지용 커넥션 (PRAGMA data_version은 커넥션마다 따로 계산된다)
+_version_conn = None
+_version_lock = threading.Lock()
+
+
+def _read_frame(query, conn, params=None):
+    # pandas는 조회 결과를 DataFrame으로 만들 때만 불러온다 (로그인 화면 콜드 스타트 단축)
+    import pandas as pd
+    started = time.perf_counter()
+    frame = pd.read_sql_query(query, conn, params=params)
+    metrics.check_slow_query(conn, query, params, time.perf_counter() - started)
+    return frame
+
+
+def timed_execute(conn, sql, params=()):
+    # conn.execute와 같지만 느린 쿼리면 EXPLAIN QUERY PLAN을 남긴다 (writer 트랜잭션 안의 쿼리도 같은 로그로)
+    started = time.perf_counter()
+    cursor = conn.execute(sql, params)
+    metrics.check_slow_query(conn, sql, params, time.perf_counter() - started)
+    return cursor
 
-DATABASE_FILE = 'reservation.db'
 
 def get_connection():
-    return sqlite3.connect(DATABASE_FILE)
+    # 새 커넥션을 열고 WAL 모드와 성능 관련 PRAGMA를 적용
+    conn = sqlite3.connect(
+        DATABASE_FILE,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
 
 
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
+@contextmanager
+def connection():
+    # 풀에서 커넥션을 빌려 쓰고 반납한다. 커밋/롤백은 호출하는 쪽에서 `with conn:`으로 처리
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = get_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_connections():
+    # 풀에 남아 있는 커넥션을 모두 닫는다 (DB 파일 교체 전 등)
+    # 파일이 바뀌면 스키마도 다시 확인해야 하므로 마이그레이션 상태도 초기화
+    global _migrated, _version_conn
+    _migrated = False
+    _occupancy.clear()
+    with _pool_lock:
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+    with _version_lock:
+        if _version_conn is not None:
+            _version_conn.close()
+            _version_conn = None
+    cache.clear()
+
+
+def use_database(path):
+    # 다른 DB 파일로 전환 (벤치마크/부하 테스트가 복사본을 쓸 때). 다음 init_db()에서 스키마를 다시 확인한다
+    global DATABASE_FILE
+    close_connections()
+    DATABASE_FILE = path
+
+
+def data_version():
+    # 이 프로세스 밖(다른 커넥션 포함)에서 커밋이 일어나면 값이 바뀐다
+    global _version_conn
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = get_connection()
+        return _version_conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+_commit_listeners = []
+
+
+def add_commit_listener(listener):
+    # 쓰기 커밋 후 listener(*tables)가 호출된다 (예: GitHub 스냅샷 업로드 예약)
+    _commit_listeners.append(listener)
+
+
+def committed(*tables):
+    # 쓰기 커밋 후 호출: 해당 테이블을 읽는 캐시 항목 무효화 후 리스너에 알림
+    cache.invalidate(*tables)
+    for listener in _commit_listeners:
+        listener(*tables)
+
+
+cache.set_version_source(data_version)
+cache.on_external_change(_occupancy.clear)
+
+
+def _migration_1(c):
+    # 기본 테이블 생성 (구버전 DB의 누락 컬럼 보정 포함)
     c.execute('''
         CREATE TABLE IF NOT EXISTS reservations (
             id INTEGER PRIMARY KEY,
@@ -30,7 +159,7 @@ def init_db():
             team_color TEXT
         )
     ''')
-    
+
     # 팀 컬럼이 없는 경우 추가
     c.execute('PRAGMA table_info(users)')
     columns = [column[1] for column in c.fetchall()]
@@ -38,60 +167,739 @@ def init_db():
         c.execute('ALTER TABLE users ADD COLUMN team TEXT')
     if 'team_color' not in columns:
         c.execute('ALTER TABLE users ADD COLUMN team_color TEXT')
-    
-    conn.commit()
-    conn.close()
 
+
+def _migration_2(c):
+    # 학번 중복 계정은 가장 먼저 가입한 계정만 남기고 UNIQUE 인덱스 생성.
+    # 뺀 계정은 비밀번호를 제외하고 duplicate_users 테이블로 옮긴 뒤 로그에 남긴다
+    c.execute('CREATE TABLE IF NOT EXISTS duplicate_users AS SELECT id, student_id, name, team, team_color FROM users WHERE 0')
+    c.execute('''
+        INSERT INTO duplicate_users
+        SELECT id, student_id, name, team, team_color FROM users
+        WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY student_id)
+    ''')
+    dropped = c.execute('SELECT id, student_id FROM duplicate_users ORDER BY student_id, id').fetchall()
+    if dropped:
+        log.warning("Moved %d duplicate user rows to duplicate_users (id, student_id): %s", len(dropped), dropped)
+    c.execute('''
+        DELETE FROM users
+        WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY student_id)
+    ''')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_student_id ON users(student_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_team ON users(team)')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservations_date_time
+        ON reservations(reservation_date, start_time, end_time)
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_reservations_student_id ON reservations(student_id)')
+    c.execute('ANALYZE')
+
+
+def _migration_3(c):
+    # 예약 시간을 TEXT('%H:%M' / '%H:%M:%S' 혼재)에서 정수(날짜 번호, 자정 기준 분)로 변환
+    c.execute('''
+        CREATE TABLE reservations_new (
+            id INTEGER PRIMARY KEY,
+            student_id TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            start_min INTEGER NOT NULL CHECK (start_min >= 0 AND start_min < 1440),
+            end_min INTEGER NOT NULL CHECK (end_min > start_min AND end_min <= 1440)
+        )
+    ''')
+    rows, invalid, malformed = [], [], []
+    for reservation_id, student_id, start_time, end_time, reservation_date in c.execute(
+            'SELECT id, student_id, start_time, end_time, reservation_date FROM reservations').fetchall():
+        try:
+            start = to_minutes(start_time)
+            end = to_end_minutes(end_time, start)
+            day = to_day(reservation_date)
+        except (TypeError, ValueError):
+            malformed.append((reservation_id, start_time, end_time, reservation_date))
+            continue
+        if 0 <= start < end <= MINUTES_PER_DAY:
+            rows.append((reservation_id, student_id, day, start, end))
+        else:
+            invalid.append(reservation_id)
+    # 읽을 수 없는 시각/날짜가 있으면 추측하지 않고 마이그레이션을 멈춘다 (트랜잭션은 롤백된다)
+    if malformed:
+        raise ValueError(
+            f"Cannot migrate {len(malformed)} reservations with malformed time or date "
+            f"(id, start_time, end_time, reservation_date): {malformed}")
+    # 시작이 종료보다 늦은 잘못된 행은 invalid_reservations 테이블로 옮긴 뒤 로그에 남긴다
+    c.execute('CREATE TABLE IF NOT EXISTS invalid_reservations AS SELECT * FROM reservations WHERE 0')
+    c.executemany('INSERT INTO invalid_reservations SELECT * FROM reservations WHERE id = ?', [(i,) for i in invalid])
+    if invalid:
+        log.warning("Moved %d reservations with start >= end to invalid_reservations (ids): %s", len(invalid), invalid)
+    c.executemany('INSERT INTO reservations_new (id, student_id, day, start_min, end_min) VALUES (?, ?, ?, ?, ?)', rows)
+    c.execute('DROP TABLE reservations')
+    c.execute('ALTER TABLE reservations_new RENAME TO reservations')
+    c.execute('CREATE INDEX idx_reservations_day_time ON reservations(day, start_min, end_min)')
+    c.execute('CREATE INDEX idx_reservations_student_id ON reservations(student_id)')
+    c.execute('ANALYZE')
+
+
+def _migration_4(c):
+    # 보관 파일로 옮긴 예약의 id가 다시 쓰이지 않도록 AUTOINCREMENT로 바꾸고 보관 파일 목록 테이블 생성
+    c.execute('''
+        CREATE TABLE reservations_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            start_min INTEGER NOT NULL CHECK (start_min >= 0 AND start_min < 1440),
+            end_min INTEGER NOT NULL CHECK (end_min > start_min AND end_min <= 1440)
+        )
+    ''')
+    c.execute('INSERT INTO reservations_new (id, student_id, day, start_min, end_min) SELECT id, student_id, day, start_min, end_min FROM reservations')
+    c.execute('DROP TABLE reservations')
+    c.execute('ALTER TABLE reservations_new RENAME TO reservations')
+    c.execute('CREATE INDEX idx_reservations_day_time ON reservations(day, start_min, end_min)')
+    c.execute('CREATE INDEX idx_reservations_student_id ON reservations(student_id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            name TEXT PRIMARY KEY,
+            first_day INTEGER NOT NULL,
+            last_day INTEGER NOT NULL,
+            row_count INTEGER NOT NULL
+        )
+    ''')
+
+
+def _migration_5(c):
+    # 여러 예약 대상(방, 장비) 지원: resources 테이블, 예약의 resource_id(기존 예약은 기본 대상), 대상이 앞에 오는 인덱스.
+    # 대상을 지정한 조회/중복 확인은 새 인덱스를, 전체 목록(관리자, 내보내기)은 기존 날짜 인덱스를 쓴다
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS resources (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            weekly_quota_hours REAL
+        )
+    ''')
+    c.executemany('INSERT OR IGNORE INTO resources (name) VALUES (?)', [(name,) for name in RESOURCES])
+    c.execute(f'ALTER TABLE reservations ADD COLUMN resource_id INTEGER NOT NULL DEFAULT {DEFAULT_RESOURCE_ID} REFERENCES resources(id)')
+    c.execute('CREATE INDEX idx_reservations_resource_day_time ON reservations(resource_id, day, start_min, end_min)')
+    c.execute('ANALYZE')
+
+
+def _migration_6(c):
+    # 평문으로 저장된 비밀번호를 auth.hash_password 형식으로 바꾼다 (로그인은 학번으로 찾은 뒤 해시를 검증)
+    rows = [(user_id, password) for user_id, password in c.execute('SELECT id, password FROM users').fetchall()
+            if not auth.is_hashed(password)]
+    hashes = auth.hash_passwords([password for _, password in rows])
+    c.executemany('UPDATE users SET password = ? WHERE id = ?', [(h, user_id) for h, (user_id, _) in zip(hashes, rows)])
+
+
+def _migration_7(c):
+    # 가져오는 시간표를 writer 밖에서 chunk 단위로 나눠 커밋해 두는 작업 테이블 (가져오기마다 batch로 구분).
+    # 메모리 임시 테이블이 아니라 DB 파일에 있으므로 큰 파일도 RAM에 올리지 않는다
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS import_rows (
+            batch TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            student_id TEXT,
+            resource_id INTEGER,
+            day INTEGER,
+            start_min INTEGER,
+            end_min INTEGER,
+            reason TEXT,
+            PRIMARY KEY (batch, line)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_import_rows_day ON import_rows(batch, resource_id, day, start_min)')
+
+
+# 스키마 마이그레이션 목록. 순서대로 적용되며 PRAGMA user_version에 적용된 개수를 기록한다.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+]
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+def migrate(conn):
+    # 아직 적용되지 않은 마이그레이션을 하나의 트랜잭션으로 적용
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        c = conn.cursor()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(c)
+            c.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def init_db():
+    # 프로세스당 한 번만 스키마를 확인/업그레이드한다 (Streamlit rerun마다 호출되어도 비용 없음)
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if _migrated:
+            return
+        with connection() as conn:
+            migrate(conn)
+        _migrated = True
+        cache.clear()
+
+
+# 로그인한 사용자 (비밀번호 제외)
+User = namedtuple('User', ['id', 'student_id', 'name', 'team', 'team_color'])
+
+
+@instrument('query.add_user')
 def add_user(student_id, name, password, team, team_color):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("INSERT INTO users (student_id, name, password, team, team_color) VALUES (?, ?, ?, ?, ?)",
-              (student_id, name, password, team, team_color))
-    conn.commit()
-    conn.close()
+    # 이미 가입된 학번이면 False (users.student_id UNIQUE 인덱스). 비밀번호는 해시로 저장
+    password_hash = auth.hash_password(password)
+    try:
+        with connection() as conn, conn:
+            conn.execute("INSERT INTO users (student_id, name, password, team, team_color) VALUES (?, ?, ?, ?, ?)",
+                         (student_id, name, password_hash, team, team_color))
+    except sqlite3.IntegrityError:
+        return False
+    committed('users')
+    return True
 
+@instrument('query.check_user')
 def check_user(student_id, password):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE student_id = ? AND password = ?", (student_id, password))
-    user = c.fetchone()
-    conn.close()
-    return user
+    # 학번 UNIQUE 인덱스로 한 행만 읽고 비밀번호는 커넥션을 돌려준 뒤 검증한다. 맞으면 User, 아니면 None
+    with connection() as conn:
+        row = timed_execute(conn, "SELECT id, student_id, name, team, team_color, password FROM users WHERE student_id = ?",
+                            (student_id,)).fetchone()
+    # 없는 학번도 같은 시간이 걸리도록 대신 검증한다
+    verified = auth.verify_password(row[-1] if row else auth.dummy_hash(), password)
+    if row is None or not verified:
+        return None
+    return User(*row[:-1])
 
 def update_team_color(team, new_color):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE users SET team_color = ? WHERE team = ?", (new_color, team))
-    conn.commit()
-    conn.close()
+    with connection() as conn, conn:
+        conn.execute("UPDATE users SET team_color = ? WHERE team = ?", (new_color, team))
+    committed('users')
 
+@instrument('query.update_user')
 def update_user(student_id, new_name, new_team, new_student_id, new_team_color):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE users SET name = ?, team = ?, student_id = ?, team_color = ? WHERE student_id = ?", 
-              (new_name, new_team, new_student_id, new_team_color, student_id))
-    conn.commit()
-    conn.close()
+    # 바꾸려는 학번이 이미 가입되어 있으면 False (users.student_id UNIQUE 인덱스)
+    try:
+        with connection() as conn, conn:
+            conn.execute("UPDATE users SET name = ?, team = ?, student_id = ?, team_color = ? WHERE student_id = ?",
+                         (new_name, new_team, new_student_id, new_team_color, student_id))
+    except sqlite3.IntegrityError:
+        return False
+    committed('users')
     update_team_color(new_team, new_team_color)
+    # 팀이 바뀌면 팀별 점유 정보가 달라지므로 다음 조회 때 다시 만든다
+    _occupancy.clear()
+    return True
 
-def insert_reservation(student_id, start_time, end_time, reservation_date):
-    conn = get_connection()
-    c = conn.cursor()
-    query = """
-        INSERT INTO reservations (student_id, start_time, end_time, reservation_date)
-        VALUES (?, ?, ?, ?)
-    """
-    c.execute(query, (student_id, start_time, end_time, reservation_date))
-    conn.commit()
-    conn.close()
-
-def get_reservations():
-    conn = get_connection()
-    query = """
-        SELECT r.*, u.team 
-        FROM reservations r
+# 예약 요청 처리 결과. accepted가 False면 reason에 거절 사유가 들어간다
+ReservationResult = namedtuple('ReservationResult', ['accepted', 'reason', 'reservation_id'])
+
+CONFLICT = "다른 팀이 이미 해당 시간에 예약을 했습니다."
+QUOTA_EXCEEDED = "남은 예약 가능 시간을 초과했습니다."
+UNKNOWN_USER = "등록되지 않은 사용자입니다."
+INVALID_TIME = "종료 시간은 시작 시간 이후여야 합니다."
+CANCELLED = "다른 슬롯을 예약할 수 없어 함께 취소되었습니다."
+IMPORT_OVERLAP = "가져오는 파일의 앞선 행과 시간이 겹칩니다."
+UNKNOWN_RESOURCE = "등록되지 않은 예약 대상입니다."
+
+# 예약 가져오기 결과. rejected는 (파일 행 번호, 사유) 목록
+ImportResult = namedtuple('ImportResult', ['accepted', 'reason', 'imported', 'rejected'])
+
+
+# 예약 대상. weekly_quota_hours는 대상별 설정이 없으면 WEEKLY_QUOTA_HOURS
+Resource = namedtuple('Resource', ['id', 'name', 'weekly_quota_hours'])
+
+
+@cached('resources')
+def get_resources():
+    with connection() as conn:
+        return [Resource(*row) for row in conn.execute(
+            "SELECT id, name, COALESCE(weekly_quota_hours, ?) FROM resources ORDER BY id", (WEEKLY_QUOTA_HOURS,))]
+
+def add_resource(name, weekly_quota_hours=None):
+    # 이미 있는 이름이면 False
+    try:
+        with connection() as conn, conn:
+            conn.execute("INSERT INTO resources (name, weekly_quota_hours) VALUES (?, ?)", (name, weekly_quota_hours))
+    except sqlite3.IntegrityError:
+        return False
+    committed('resources')
+    return True
+
+def quota_minutes(conn, resource_id):
+    # 대상의 팀별 주간 예약 가능 시간(분). 없는 대상이면 None
+    row = conn.execute("SELECT COALESCE(weekly_quota_hours, ?) FROM resources WHERE id = ?",
+                       (WEEKLY_QUOTA_HOURS, resource_id)).fetchone()
+    return None if row is None else row[0] * 60
+
+
+def recurring_slots(start_date, end_date, weekdays, start_time, end_time):
+    # start_date ~ end_date(포함) 중 weekdays(월=0 ... 일=6)에 해당하는 날마다 같은 시간대 슬롯
+    first = from_day(to_day(start_date))
+    return [(first + timedelta(days=offset), start_time, end_time)
+            for offset in range(to_day(end_date) - to_day(start_date) + 1)
+            if (first + timedelta(days=offset)).weekday() in weekdays]
+
+
+def book_slots(conn, student_id, slots, all_or_nothing=True, resource_id=DEFAULT_RESOURCE_ID):
+    # 한 예약 대상의 여러 슬롯을 한 번에 확인하고 저장한다. 호출하는 쪽(writer)의 트랜잭션 안에서 실행된다.
+    # 같은 대상의 기존 예약과의 중복과 팀의 주간 사용량은 SQL 한 번으로 읽고,
+    # 앞선 슬롯과의 중복과 주간 누적은 받아들인 슬롯만으로 계산한 뒤 executemany로 삽입.
+    # 반환: (슬롯별 ReservationResult 목록, 점유 인덱스에 반영할 행 목록, 인덱스에서 뺄 id 목록)
+    results = [None] * len(slots)
+    candidates = []
+    for idx, (reservation_date, start_time, end_time) in enumerate(slots):
+        start = to_minutes(start_time)
+        end = to_end_minutes(end_time, start)
+        if start >= end:
+            results[idx] = ReservationResult(False, INVALID_TIME, None)
+        else:
+            candidates.append((idx, to_day(reservation_date), start, end))
+
+    user = conn.execute("SELECT team FROM users WHERE student_id = ?", (student_id,)).fetchone()
+    if user is None:
+        return [ReservationResult(False, UNKNOWN_USER, None) for _ in slots], [], []
+    team = user[0]
+    quota = quota_minutes(conn, resource_id)
+    if quota is None:
+        return [ReservationResult(False, UNKNOWN_RESOURCE, None) for _ in slots], [], []
+
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_slots (idx INTEGER PRIMARY KEY, day INTEGER, start_min INTEGER, end_min INTEGER)')
+    conn.execute('DELETE FROM temp.bulk_slots')
+    conn.executemany('INSERT INTO temp.bulk_slots (idx, day, start_min, end_min) VALUES (?, ?, ?, ?)', candidates)
+    checked = timed_execute(conn, """
+        WITH checked AS (
+            SELECT s.idx, s.day, s.start_min, s.end_min, s.day - (s.day + 3) % 7 AS week,
+                   EXISTS (
+                       SELECT 1 FROM reservations r
+                       WHERE r.resource_id = ? AND r.day = s.day AND r.start_min < s.end_min AND r.end_min > s.start_min
+                   ) AS conflict
+            FROM temp.bulk_slots s
+        ),
+        used AS (
+            SELECT r.day - (r.day + 3) % 7 AS week, SUM(r.end_min - r.start_min) AS minutes
+            FROM reservations r
+            JOIN users u ON r.student_id = u.student_id
+            WHERE u.team = ? AND r.resource_id = ?
+            AND r.day BETWEEN (SELECT MIN(day) - 6 FROM temp.bulk_slots) AND (SELECT MAX(day) + 6 FROM temp.bulk_slots)
+            GROUP BY week
+        )
+        SELECT c.idx, c.week, c.conflict, COALESCE(u.minutes, 0)
+        FROM checked c
+        LEFT JOIN used u ON u.week = c.week
+        ORDER BY c.idx
+    """, (resource_id, team, resource_id)).fetchall()
+
+    accepted = []
+    by_idx = {candidate[0]: candidate for candidate in candidates}
+    week_minutes = {}
+    accepted_by_day = defaultdict(list)
+    for idx, week, conflict, used in checked:
+        _, day, start, end = by_idx[idx]
+        if conflict or any(s < end and e > start for s, e in accepted_by_day[day]):
+            results[idx] = ReservationResult(False, CONFLICT, None)
+            continue
+        minutes = week_minutes.get(week, used) + end - start
+        if team is not None and minutes > quota:
+            results[idx] = ReservationResult(False, QUOTA_EXCEEDED, None)
+            continue
+        week_minutes[week] = minutes
+        accepted_by_day[day].append((start, end))
+        accepted.append(by_idx[idx])
+
+    if all_or_nothing and len(accepted) < len(slots):
+        for idx, _, _, _ in accepted:
+            results[idx] = ReservationResult(False, CANCELLED, None)
+        return results, [], []
+    if not accepted:
+        return results, [], []
+
+    conn.executemany("INSERT INTO reservations (student_id, resource_id, day, start_min, end_min) VALUES (?, ?, ?, ?, ?)",
+                     [(student_id, resource_id, day, start, end) for _, day, start, end in accepted])
+    # 같은 대상에는 겹치는 예약이 없으므로 (day, start_min)으로 새 id를 찾을 수 있다
+    ids = dict(((day, start), reservation_id) for reservation_id, day, start in conn.execute(
+        "SELECT id, day, start_min FROM reservations WHERE resource_id = ? AND student_id = ? AND day BETWEEN ? AND ?",
+        (resource_id, student_id, min(c[1] for c in accepted), max(c[1] for c in accepted))))
+    indexed = []
+    for idx, day, start, end in accepted:
+        results[idx] = ReservationResult(True, None, ids[(day, start)])
+        indexed.append((ids[(day, start)], resource_id, day, team, start, end))
+    return results, indexed, []
+
+
+def insert_reservation(student_id, start_time, end_time, reservation_date, resource_id=DEFAULT_RESOURCE_ID):
+    day = to_day(reservation_date)
+    start = to_minutes(start_time)
+    end = to_end_minutes(end_time, start)
+    with connection() as conn, conn:
+        query = """
+            INSERT INTO reservations (student_id, resource_id, day, start_min, end_min)
+            VALUES (?, ?, ?, ?, ?)
+        """
+        reservation_id = conn.execute(query, (student_id, resource_id, day, start, end)).lastrowid
+        team = conn.execute("SELECT team FROM users WHERE student_id = ?", (student_id,)).fetchone()
+    committed('reservations')
+    index_reservation(reservation_id, resource_id, day, team[0] if team else None, start, end)
+    return reservation_id
+
+def index_reservation(reservation_id, resource_id, day, team, start_min, end_min):
+    # 커밋된 예약을 점유 인덱스에 반영 (아직 만들어지지 않았으면 첫 조회 때 DB에서 만든다)
+    if _occupancy.tracking:
+        _occupancy.add(reservation_id, resource_id, day, team, start_min, end_min)
+
+# get_reservations에서 선택할 수 있는 컬럼.
+# day/start_min/end_min은 저장된 정수 그대로, reservation_date/start_time/end_time은 화면 표시용 문자열
+RESERVATION_COLUMNS = {
+    'id': 'r.id',
+    'student_id': 'r.student_id',
+    'name': 'u.name',
+    'team': 'u.team',
+    'resource_id': 'r.resource_id',
+    'resource': 's.name',
+    'day': 'r.day',
+    'start_min': 'r.start_min',
+    'end_min': 'r.end_min',
+    'reservation_date': sql_date('r.day'),
+    'start_time': sql_time('r.start_min'),
+    'end_time': sql_time('r.end_min'),
+}
+DEFAULT_RESERVATION_COLUMNS = ('id', 'student_id', 'start_time', 'end_time', 'reservation_date', 'team')
+# keyset 페이지네이션 정렬 키 (idx_reservations_day_time 인덱스 순서와 같다)
+RESERVATION_ORDER = ('day', 'start_min', 'end_min', 'id')
+
+
+def _reservation_query(columns, start_date=None, end_date=None, team=None, student_id=None, after=None, resource_id=None):
+    # (스키마 자리({source})가 남은 SELECT 문, 파라미터)
+    unknown = set(columns) - RESERVATION_COLUMNS.keys()
+    if unknown:
+        raise ValueError(f"Unknown reservation columns: {sorted(unknown)}")
+    conditions = []
+    params = []
+    if start_date is not None:
+        conditions.append('r.day >= ?')
+        params.append(to_day(start_date))
+    if end_date is not None:
+        conditions.append('r.day <= ?')
+        params.append(to_day(end_date))
+    if team is not None:
+        conditions.append('u.team = ?')
+        params.append(team)
+    if student_id is not None:
+        conditions.append('r.student_id = ?')
+        params.append(student_id)
+    if resource_id is not None:
+        conditions.append('r.resource_id = ?')
+        params.append(resource_id)
+    if after is not None:
+        conditions.append('(r.day, r.start_min, r.end_min, r.id) > (?, ?, ?, ?)')
+        params.extend(after)
+
+    query = f"""
+        SELECT {', '.join(f'{RESERVATION_COLUMNS[c]} AS {c}' for c in columns)}
+        FROM {{source}}.reservations r
         JOIN users u ON r.student_id = u.student_id
+        {'LEFT JOIN main.resources s ON s.id = r.resource_id' if 'resource' in columns else ''}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY r.day, r.start_min, r.end_min, r.id
+    """
+    return query, params
+
+@cached('reservations', 'users', 'resources')
+@instrument('query.get_reservations')
+def get_reservations(start_date=None, end_date=None, team=None, student_id=None,
+                     after=None, limit=None, columns=DEFAULT_RESERVATION_COLUMNS, resource_id=None):
+    # 날짜 범위/팀/학번/예약 대상으로 걸러낸 예약 목록 (resource_id가 None이면 모든 대상).
+    # limit를 주면 한 페이지만 읽고, 다음 페이지는 reservation_cursor(이전 결과)를 after로 넘겨 이어서 읽는다
+    if limit is not None:
+        columns = tuple(columns) + tuple(c for c in RESERVATION_ORDER if c not in columns)
+    query, params = _reservation_query(columns, start_date, end_date, team, student_id, after, resource_id)
+    if limit is not None:
+        query += ' LIMIT ?'
+    with connection() as conn:
+        if start_date is None and end_date is None:
+            return _read_frame(query.format(source='main'), conn, params=params + [limit] * (limit is not None))
+        # 보관 기간이 지난 날짜가 포함되면 해당 보관 파일을 날짜 순으로 하나씩 붙여 읽는다 (현재 DB가 마지막)
+        from archive import sources
+        frames = []
+        remaining = limit
+        for source in sources(conn, None if start_date is None else to_day(start_date),
+                              None if end_date is None else to_day(end_date)):
+            frame = _read_frame(query.format(source=source), conn,
+                                params=params + [remaining] * (limit is not None))
+            frames.append(frame)
+            if limit is not None:
+                remaining -= len(frame)
+                if remaining <= 0:
+                    break
+        if len(frames) == 1:
+            return frames[0]
+        import pandas as pd
+        return pd.concat(frames, ignore_index=True)
+
+def iter_reservations(start_date=None, end_date=None, team=None, columns=DEFAULT_RESERVATION_COLUMNS,
+                      chunksize=EXPORT_CHUNK_SIZE, resource_id=None):
+    # 보관 파일을 포함한 예약을 날짜 순으로 chunksize행씩 DataFrame으로 돌려준다 (메모리는 chunk 하나 크기로 제한)
+    import pandas as pd
+    from archive import sources
+    query, params = _reservation_query(columns, start_date, end_date, team, resource_id=resource_id)
+    with connection() as conn:
+        for source in sources(conn, None if start_date is None else to_day(start_date),
+                              None if end_date is None else to_day(end_date)):
+            yield from pd.read_sql_query(query.format(source=source), conn, params=params, chunksize=chunksize)
+
+def iter_users(chunksize=EXPORT_CHUNK_SIZE):
+    # 학번 순 유저 목록을 chunksize행씩 (비밀번호 제외)
+    import pandas as pd
+    with connection() as conn:
+        yield from pd.read_sql_query("SELECT id, student_id, name, team, team_color FROM users ORDER BY student_id",
+                                     conn, chunksize=chunksize)
+
+def reservation_cursor(page, limit):
+    # 다음 페이지를 읽을 keyset 커서. 마지막 페이지면 None
+    if len(page) < limit:
+        return None
+    last = page.iloc[-1]
+    return tuple(int(last[c]) for c in RESERVATION_ORDER)
+
+@instrument('query.rebuild_occupancy')
+def rebuild_occupancy():
+    # reservations 테이블 전체에서 점유 인덱스를 다시 만든다.
+    # 읽는 동안 커밋된 예약은 인덱스가 모아 두었다가 반영하고, 외부 변경으로 비워졌으면 다시 읽는다
+    with _rebuild_lock:
+        while True:
+            generation = _occupancy.begin_rebuild()
+            with connection() as conn:
+                rows = conn.execute("""
+                    SELECT r.id, r.resource_id, r.day, u.team, r.start_min, r.end_min
+                    FROM reservations r
+                    LEFT JOIN users u ON r.student_id = u.student_id
+                """).fetchall()
+            if _occupancy.rebuild(rows, generation):
+                return _occupancy
+
+def get_occupancy():
+    if not _occupancy.built:
+        return rebuild_occupancy()
+    return _occupancy
+
+@instrument('occupancy.find_free_windows')
+def find_free_windows(team, start_date, end_date, hours, limit=10, earliest_min=0, resource_id=DEFAULT_RESOURCE_ID):
+    # start_date ~ end_date 사이에서 대상이 hours시간 이상 연속으로 비어 있고 팀의 주간 할당량 안에 들어가는 구간 (점유 인덱스에서 계산)
+    min_slots = max(1, -(-round(hours * 60) // SLOT_MINUTES))
+    quota_slots = None
+    if team is not None:
+        quota = {resource.id: resource.weekly_quota_hours for resource in get_resources()}.get(resource_id, WEEKLY_QUOTA_HOURS)
+        quota_slots = int(quota * 60) // SLOT_MINUTES
+    return get_occupancy().free_windows(start_date, end_date, min_slots, team, quota_slots, limit,
+                                        -(-earliest_min // SLOT_MINUTES), resource_id)
+
+@cached('users')
+@instrument('query.get_users')
+def get_users(search=None, after=None, limit=None):
+    # 학번 순 유저 목록 (비밀번호 제외). search는 학번 앞부분 또는 이름 일부, after/limit는 학번 기준 keyset 페이지네이션
+    conditions = []
+    params = []
+    if search:
+        conditions.append("(student_id LIKE ? OR name LIKE ?)")
+        params.extend([f"{search}%", f"%{search}%"])
+    if after is not None:
+        conditions.append("student_id > ?")
+        params.append(after)
+    query = f"""
+        SELECT id, student_id, name, team, team_color
+        FROM users
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY student_id
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
\ No newline at end of file
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    with connection() as conn:
+        return _read_frame(query, conn, params=params)
+
+def user_cursor(page, limit):
+    # 다음 유저 페이지를 읽을 커서. 마지막 페이지면 None
+    if len(page) < limit:
+        return None
+    return page.iloc[-1]['student_id']
+
+def clear_occupancy():
+    # 점유 인덱스를 비워 다음 조회 때 DB에서 다시 만들게 한다
+    _occupancy.clear()
+
+def unindex_reservation(reservation_id):
+    _occupancy.remove(reservation_id)
+
+
+# 관리자 일괄 작업. writer 트랜잭션 안에서 실행되며 (결과, 점유 인덱스에 반영할 행, 인덱스에서 뺄 id)를 돌려준다
+
+def _changed_rows(conn, ids):
+    placeholders = ', '.join('?' * len(ids))
+    return conn.execute(f"""
+        SELECT r.id, r.resource_id, r.day, u.team, r.start_min, r.end_min
+        FROM reservations r
+        LEFT JOIN users u ON r.student_id = u.student_id
+        WHERE r.id IN ({placeholders})
+    """, list(ids)).fetchall()
+
+def _apply_change(conn, ids, statements):
+    # statements를 실행한 뒤 바뀐 예약이 다른 예약과 겹치면 모두 되돌린다
+    if not ids:
+        return ReservationResult(True, None, None), [], []
+    conn.execute('SAVEPOINT admin_change')
+    try:
+        for statement, params in statements:
+            if params and isinstance(params[0], (list, tuple)):
+                conn.executemany(statement, params)
+            else:
+                conn.execute(statement, params)
+    except sqlite3.IntegrityError:
+        conn.execute('ROLLBACK TO admin_change')
+        conn.execute('RELEASE admin_change')
+        return ReservationResult(False, INVALID_TIME, None), [], []
+    placeholders = ', '.join('?' * len(ids))
+    overlap = conn.execute(f"""
+        SELECT 1 FROM reservations a
+        JOIN reservations b ON b.resource_id = a.resource_id AND b.day = a.day AND b.id <> a.id
+            AND b.start_min < a.end_min AND b.end_min > a.start_min
+        WHERE a.id IN ({placeholders})
+        LIMIT 1
+    """, list(ids)).fetchone()
+    if overlap:
+        conn.execute('ROLLBACK TO admin_change')
+        conn.execute('RELEASE admin_change')
+        return ReservationResult(False, CONFLICT, None), [], []
+    conn.execute('RELEASE admin_change')
+    return ReservationResult(True, None, None), _changed_rows(conn, ids), []
+
+def delete_reservations(conn, ids):
+    ids = [int(i) for i in ids]
+    conn.executemany("DELETE FROM reservations WHERE id = ?", [(i,) for i in ids])
+    return ReservationResult(True, None, None), [], ids
+
+def shift_reservations(conn, ids, minutes):
+    # 선택한 예약을 minutes분만큼 앞/뒤로 이동 (하루를 벗어나면 CHECK 제약으로 실패)
+    ids = [int(i) for i in ids]
+    placeholders = ', '.join('?' * len(ids))
+    return _apply_change(conn, ids, [(
+        f"UPDATE reservations SET start_min = start_min + ?, end_min = end_min + ? WHERE id IN ({placeholders})",
+        [int(minutes), int(minutes)] + ids,
+    )])
+
+def reassign_reservations(conn, ids, student_id):
+    ids = [int(i) for i in ids]
+    if conn.execute("SELECT 1 FROM users WHERE student_id = ?", (student_id,)).fetchone() is None:
+        return ReservationResult(False, UNKNOWN_USER, None), [], []
+    placeholders = ', '.join('?' * len(ids))
+    return _apply_change(conn, ids, [(
+        f"UPDATE reservations SET student_id = ? WHERE id IN ({placeholders})",
+        [student_id] + ids,
+    )])
+
+def edit_reservations(conn, edits):
+    # edits: (id, reservation_date, start_time, end_time) 목록
+    rows = []
+    try:
+        for reservation_id, reservation_date, start_time, end_time in edits:
+            start = to_minutes(start_time)
+            rows.append((to_day(reservation_date), start, to_end_minutes(end_time, start), int(reservation_id)))
+    except ValueError:
+        return ReservationResult(False, INVALID_TIME, None), [], []
+    return _apply_change(conn, [row[-1] for row in rows], [(
+        "UPDATE reservations SET day = ?, start_min = ?, end_min = ? WHERE id = ?",
+        rows,
+    )])
+
+def stage_import(rows, chunksize=EXPORT_CHUNK_SIZE):
+    # 가져올 행을 writer 밖에서 import_rows 테이블에 chunksize행씩 나눠 커밋한다. 반환: load_reservations에 넘길 batch.
+    # rows: (행 번호, student_id, resource_id, day, start_min, end_min, 사유) — 읽을 때 이미 잘못된 행은 사유가 채워져 있다
+    batch = uuid.uuid4().hex
+    rows = iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, chunksize))
+            if not chunk:
+                break
+            with connection() as conn, conn:
+                conn.executemany('INSERT INTO import_rows (batch, line, student_id, resource_id, day, start_min, end_min, reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 [(batch,) + row for row in chunk])
+            # 작업 테이블 커밋을 다른 프로세스의 변경으로 보고 캐시/점유 인덱스를 비우지 않게 한다
+            cache.invalidate('import_rows')
+    except Exception:
+        discard_import(batch)
+        raise
+    return batch
+
+def discard_import(batch):
+    # 가져오기가 끝났거나 실패한 batch의 작업 행을 지운다
+    with connection() as conn, conn:
+        conn.execute('DELETE FROM import_rows WHERE batch = ?', (batch,))
+    cache.invalidate('import_rows')
+
+def load_reservations(conn, batch, skip_conflicts=False):
+    # stage_import로 모아 둔 외부 시간표를 한 트랜잭션(writer) 안에서 불러온다.
+    # 여기서는 유저/예약 대상/기존 예약/파일 안 중복을 SQL로 한 번에 확인하고 삽입만 한다.
+    # skip_conflicts가 False면 하나라도 문제가 있을 때 아무것도 넣지 않는다
+    timed_execute(conn, """
+        UPDATE import_rows SET reason = ?
+        WHERE batch = ? AND reason IS NULL AND student_id NOT IN (SELECT student_id FROM users)
+    """, (UNKNOWN_USER, batch))
+    timed_execute(conn, """
+        UPDATE import_rows SET reason = ?
+        WHERE batch = ? AND reason IS NULL AND (resource_id IS NULL OR resource_id NOT IN (SELECT id FROM resources))
+    """, (UNKNOWN_RESOURCE, batch))
+    timed_execute(conn, """
+        UPDATE import_rows SET reason = ?
+        WHERE batch = ? AND reason IS NULL AND EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.resource_id = import_rows.resource_id AND r.day = import_rows.day
+            AND r.start_min < import_rows.end_min AND r.end_min > import_rows.start_min
+        )
+    """, (CONFLICT, batch))
+    # 파일 안에서 겹치면 먼저 나온 행을 남긴다. 받아들인 행과만 비교하므로 이미 밀려난 행과만 겹치는 행은 남는다.
+    # (대상, 날짜)마다 행 번호 순으로 읽어 그 날 받아들인 구간만 들고 있는다
+    overlapping = []
+    accepted = []
+    current = None
+    for line, resource_id, day, start, end in timed_execute(conn, """
+        SELECT line, resource_id, day, start_min, end_min FROM import_rows
+        WHERE batch = ? AND reason IS NULL
+        ORDER BY resource_id, day, line
+    """, (batch,)):
+        if (resource_id, day) != current:
+            current = (resource_id, day)
+            accepted = []
+        if any(s < end and e > start for s, e in accepted):
+            overlapping.append((IMPORT_OVERLAP, batch, line))
+        else:
+            accepted.append((start, end))
+    conn.executemany('UPDATE import_rows SET reason = ? WHERE batch = ? AND line = ?', overlapping)
+
+    rejected = conn.execute("SELECT line, reason FROM import_rows WHERE batch = ? AND reason IS NOT NULL ORDER BY line",
+                            (batch,)).fetchall()
+    if rejected and not skip_conflicts:
+        conn.execute('DELETE FROM import_rows WHERE batch = ?', (batch,))
+        return ImportResult(False, rejected[0][1], 0, rejected), [], []
+    imported = timed_execute(conn, """
+        INSERT INTO reservations (student_id, resource_id, day, start_min, end_min)
+        SELECT student_id, resource_id, day, start_min, end_min FROM import_rows WHERE batch = ? AND reason IS NULL ORDER BY line
+    """, (batch,)).rowcount
+    indexed = timed_execute(conn, """
+        SELECT r.id, r.resource_id, r.day, u.team, r.start_min, r.end_min
+        FROM import_rows i
+        JOIN reservations r ON r.resource_id = i.resource_id AND r.day = i.day AND r.start_min = i.start_min
+            AND r.student_id = i.student_id
+        LEFT JOIN users u ON r.student_id = u.student_id
+        WHERE i.batch = ? AND i.reason IS NULL
+    """, (batch,)).fetchall()
+    conn.execute('DELETE FROM import_rows WHERE batch = ?', (batch,))
+    return ImportResult(True, None, imported, rejected), indexed, []
@@ -0,0 +1,234 @@
+# loadtest.py
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import auth
+import database
+import persistence
+import writer
+from config import TEAM_COLORS, DATABASE_FILE
+from database import CONFLICT, QUOTA_EXCEEDED
+from timeutil import to_day, from_day, week_bounds
+
+# 한 주가 열리는 순간 여러 학생이 같은 저녁 시간대를 예약하는 상황을 재현하는 부하 테스트.
+# reservation.db 복사본에 유저를 추가하고, 세션마다 check_user → 점유 확인 → 예약 저장을 동시에 실행한다.
+# GitHub 업로드는 persistence.LocalRepo(임시 디렉터리)로 대신한다.
+# 사용법: python loadtest.py --sessions 500 --concurrency 64 --rate 0 --skew 1.5 [--processes 2] [--mode direct]
+
+# 인기 시간대 후보 (시작, 종료). 앞쪽일수록 skew에 따라 더 많이 몰린다
+EVENING_SLOTS = [('18:00', '20:00'), ('19:00', '21:00'), ('20:00', '22:00'), ('17:00', '19:00'),
+                 ('16:00', '18:00'), ('21:00', '23:00'), ('14:00', '16:00'), ('10:00', '12:00')]
+
+
+def prepare(source, workdir, users, seed=0):
+    # source DB를 workdir에 복사하고 부하 테스트용 유저를 추가한다. 복사본 경로를 돌려준다
+    path = os.path.join(workdir, os.path.basename(source))
+    if os.path.exists(source):
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+    database.use_database(path)
+    database.init_db()
+    rng = random.Random(seed)
+    teams = list(TEAM_COLORS)
+    rows = [(f"load{i:04d}", f"load{i}", password, teams[rng.randrange(len(teams))])
+            for i, password in enumerate(auth.hash_passwords([f"pw{i}" for i in range(users)]))]
+    with database.connection() as conn, conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO users (student_id, name, password, team, team_color) VALUES (?, ?, ?, ?, ?)
+        """, [(sid, name, password, team, TEAM_COLORS[team]) for sid, name, password, team in rows])
+    return path
+
+
+def candidates(days, skew):
+    # (날짜, 시작, 종료) 후보와 가중치. skew가 클수록 첫 날짜의 첫 시간대에 몰린다 (0이면 균등)
+    slots = [(day, start, end) for day in days for start, end in EVENING_SLOTS]
+    weights = [1 / (rank + 1) ** skew for rank in range(len(slots))]
+    return slots, weights
+
+
+def _is_locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def session(student_id, password, slot, mode):
+    # 세션 하나: 로그인 → 점유 확인(메인 페이지와 같은 인덱스) → 저장. 단계별 소요 시간(ms)과 결과를 돌려준다
+    day, start, end = slot
+    record = {'outcome': None}
+    started = time.perf_counter()
+    try:
+        user = database.check_user(student_id, password)
+        record['login_ms'] = (time.perf_counter() - started) * 1000
+        if user is None:
+            record['outcome'] = 'login_failed'
+            return record
+        checked = time.perf_counter()
+        free = database.get_occupancy().is_free(day, start, end)
+        record['check_ms'] = (time.perf_counter() - checked) * 1000
+        if not free:
+            record['outcome'] = 'conflict'
+            return record
+        saved = time.perf_counter()
+        if mode == 'direct':
+            # 예전 방식: 트랜잭션 밖에서 확인한 뒤 바로 INSERT
+            database.insert_reservation(student_id, start, end, from_day(day))
+            record['outcome'] = 'booked'
+        else:
+            result = writer.reserve(student_id, start, end, from_day(day))
+            if result.accepted:
+                record['outcome'] = 'booked'
+            elif result.reason == CONFLICT:
+                record['outcome'] = 'conflict'
+            elif result.reason == QUOTA_EXCEEDED:
+                record['outcome'] = 'quota'
+            elif _is_locked(result.reason):
+                record['outcome'] = 'locked'
+            else:
+                record['outcome'] = 'error'
+                record['error'] = result.reason
+        record['save_ms'] = (time.perf_counter() - saved) * 1000
+    except sqlite3.OperationalError as e:
+        record['outcome'] = 'locked' if _is_locked(e) else 'error'
+        record['error'] = str(e)
+    except Exception as e:
+        record['outcome'] = 'error'
+        record['error'] = str(e)
+    finally:
+        record['total_ms'] = (time.perf_counter() - started) * 1000
+    return record
+
+
+def run_sessions(path, sessions, concurrency, rate, skew, days, users, mode, seed):
+    # 한 프로세스 안에서 세션을 동시에 실행한다. rate(초당 도착 수)가 0이면 모든 세션이 한꺼번에 시작한다
+    database.use_database(path)
+    database.init_db()
+    database.get_occupancy()
+    rng = random.Random(seed)
+    slots, weights = candidates(days, skew)
+    plan = [(f"load{rng.randrange(users):04d}", rng.choices(slots, weights)[0]) for _ in range(sessions)]
+    gate = threading.Event()
+    records = []
+
+    def start(student_id, slot):
+        gate.wait()
+        return session(student_id, f"pw{int(student_id[4:])}", slot, mode)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for student_id, slot in plan:
+            futures.append(pool.submit(start, student_id, slot))
+            if rate > 0:
+                gate.set()
+                time.sleep(rng.expovariate(rate))
+        gate.set()
+        for future in futures:
+            records.append(future.result())
+    return records
+
+
+def _run_process(arguments):
+    return run_sessions(*arguments)
+
+
+def double_bookings(path):
+    # 서로 겹치는 예약 쌍 수 (0이어야 한다)
+    with sqlite3.connect(path) as conn:
+        return conn.execute("""
+            SELECT COUNT(*) FROM reservations a
+            JOIN reservations b ON b.resource_id = a.resource_id AND b.day = a.day AND b.id > a.id
+                AND b.start_min < a.end_min AND b.end_min > a.start_min
+        """).fetchone()[0]
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))], 2)
+    return {'p50_ms': pick(0.5), 'p99_ms': pick(0.99), 'max_ms': round(values[-1], 2), 'mean_ms': round(statistics.fmean(values), 2)}
+
+
+def summarize(records, elapsed, path):
+    outcomes = {}
+    for record in records:
+        outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+    errors = sorted({record['error'] for record in records if 'error' in record})[:10]
+    return {
+        'sessions': len(records),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(len(records) / elapsed, 1) if elapsed else None,
+        'booked_per_s': round(outcomes.get('booked', 0) / elapsed, 1) if elapsed else None,
+        'outcomes': outcomes,
+        'locked_errors': outcomes.get('locked', 0),
+        'double_bookings': double_bookings(path),
+        'latency': {step: _percentiles([r[f'{step}_ms'] for r in records if f'{step}_ms' in r])
+                    for step in ('total', 'login', 'check', 'save')},
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent booking sessions against a copy of the database.")
+    parser.add_argument('--db', default=DATABASE_FILE, help="database to copy (a new one is created if missing)")
+    parser.add_argument('--sessions', type=int, default=200, help="sessions per process")
+    parser.add_argument('--concurrency', type=int, default=32, help="concurrent sessions per process")
+    parser.add_argument('--processes', type=int, default=1, help="app processes sharing the database file")
+    parser.add_argument('--rate', type=float, default=0, help="arrivals per second per process (0: everyone at once)")
+    parser.add_argument('--skew', type=float, default=1.2, help="Zipf exponent over candidate slots (0: uniform)")
+    parser.add_argument('--days', type=int, default=1, help="number of days in the opening week to spread bookings over")
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--mode', choices=['writer', 'direct'], default='writer',
+                        help="writer: app's transactional writer, direct: check then insert without a transaction")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--persist-delay', type=float, default=1.0, help="snapshot upload debounce for the local stub")
+    parser.add_argument('--out', help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    out = os.path.abspath(args.out) if args.out else None
+    workdir = tempfile.mkdtemp(prefix='lab-load-')
+    path = prepare(os.path.abspath(args.db), workdir, args.users, args.seed)
+    os.chdir(workdir)
+
+    # GitHub 대신 로컬 디렉터리에 스냅샷을 올린다
+    service = persistence.start(lambda: persistence.LocalRepo(os.path.join(workdir, 'remote')))
+    service.delay = args.persist_delay
+
+    monday, _ = week_bounds(to_day(date.today() + timedelta(weeks=1)))
+    days = list(range(monday, monday + args.days))
+    started = time.perf_counter()
+    if args.processes == 1:
+        records = run_sessions(path, args.sessions, args.concurrency, args.rate, args.skew, days, args.users, args.mode, args.seed)
+    else:
+        jobs = [(path, args.sessions, args.concurrency, args.rate, args.skew, days, args.users, args.mode, args.seed + i)
+                for i in range(args.processes)]
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            records = [record for result in pool.map(_run_process, jobs) for record in result]
+    elapsed = time.perf_counter() - started
+
+    report = summarize(records, elapsed, path)
+    report['config'] = {key: value for key, value in vars(args).items() if key != 'out'}
+    service.flush()
+    report['snapshot_pushes'] = service.pushes
+    report['workdir'] = workdir
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if report['double_bookings'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# metrics.py
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from config import METRICS_BUCKETS_MS, METRICS_SLOW_QUERY_MS, METRICS_SLOW_LOG_SIZE, METRICS_FILE, METRICS_EXPORT_INTERVAL_SECONDS
+
+# 프로세스 안에서만 모으는 지표 (외부 서비스 없음).
+# 이름별 소요 시간 히스토그램과 행 수, 느린 쿼리 로그(EXPLAIN QUERY PLAN 포함)를 유지하고
+# Prometheus 텍스트 형식 파일로 내보낸다. 이름 예: query.get_reservations, page.main, figure.daily_occupancy
+
+_lock = threading.Lock()
+_histograms = {}  # name -> [버킷별 개수..., +Inf 개수]
+_sums = {}  # name -> 소요 시간 합계(초)
+_maxima = {}  # name -> 최대 소요 시간(초)
+_rows = {}  # name -> 반환한 행 수 합계
+slow_queries = deque(maxlen=METRICS_SLOW_LOG_SIZE)
+_current = threading.local()  # 실행 중인 instrument 이름 스택 (느린 쿼리 로그에 쓸 이름)
+_last_export = 0.0
+
+
+def observe(name, seconds, rows=None):
+    milliseconds = seconds * 1000
+    with _lock:
+        counts = _histograms.get(name)
+        if counts is None:
+            counts = _histograms[name] = [0] * (len(METRICS_BUCKETS_MS) + 1)
+            _sums[name] = 0.0
+            _maxima[name] = 0.0
+        for i, bound in enumerate(METRICS_BUCKETS_MS):
+            if milliseconds <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        _sums[name] += seconds
+        _maxima[name] = max(_maxima[name], seconds)
+        if rows is not None:
+            _rows[name] = _rows.get(name, 0) + rows
+
+
+def _row_count(result):
+    # DataFrame/list는 행 수를 센다. 튜플은 여러 값을 돌려주는 함수의 반환값이므로 세지 않는다
+    if isinstance(result, tuple) or not hasattr(result, '__len__'):
+        return None
+    return len(result)
+
+
+@contextmanager
+def timer(name):
+    # with timer('figure.daily_occupancy') as record: ... record['rows'] = n
+    record = {}
+    stack = _current.__dict__.setdefault('names', [])
+    stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        stack.pop()
+        observe(name, time.perf_counter() - started, record.get('rows'))
+
+
+def instrument(name):
+    # 함수 호출마다 소요 시간과 반환 행 수를 기록하는 데코레이터
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name) as record:
+                result = func(*args, **kwargs)
+                record['rows'] = _row_count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def current_name(default='query'):
+    stack = getattr(_current, 'names', None)
+    return stack[-1] if stack else default
+
+
+def check_slow_query(conn, sql, params, seconds):
+    # 느린 쿼리는 같은 커넥션에서 EXPLAIN QUERY PLAN을 떠서 기록한다
+    if seconds * 1000 < METRICS_SLOW_QUERY_MS:
+        return
+    try:
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or []).fetchall()]
+    except Exception as e:
+        plan = [f"EXPLAIN failed: {e}"]
+    slow_queries.appendleft({
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'name': current_name(),
+        'ms': round(seconds * 1000, 1),
+        'sql': ' '.join(sql.split()),
+        'params': list(params or []),
+        'plan': plan,
+    })
+
+
+def summary():
+    # 이름별 요약 (관리자 화면용). 분위수는 히스토그램 버킷 상한으로 추정
+    rows = []
+    with _lock:
+        for name, counts in sorted(_histograms.items()):
+            total = sum(counts)
+            rows.append({
+                'name': name,
+                'count': total,
+                'mean_ms': round(_sums[name] / total * 1000, 1),
+                'p50_ms': _quantile(counts, total, 0.5),
+                'p95_ms': _quantile(counts, total, 0.95),
+                'max_ms': round(_maxima[name] * 1000, 1),
+                'rows': _rows.get(name),
+            })
+    return rows
+
+
+def _quantile(counts, total, q):
+    seen = 0
+    for bound, count in zip(METRICS_BUCKETS_MS, counts):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return float('inf')
+
+
+def _label(name):
+    return name.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text(extra_gauges=None):
+    # Prometheus 텍스트 노출 형식. extra_gauges: {지표 이름: 값} (예: 캐시 적중 수)
+    lines = [
+        '# HELP lab_duration_seconds Latency of instrumented queries, pages and background jobs.',
+        '# TYPE lab_duration_seconds histogram',
+    ]
+    with _lock:
+        for name, counts in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS_MS, counts):
+                cumulative += count
+                lines.append(f'lab_duration_seconds_bucket{{name="{_label(name)}",le="{bound / 1000:g}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'lab_duration_seconds_bucket{{name="{_label(name)}",le="+Inf"}} {cumulative}')
+            lines.append(f'lab_duration_seconds_sum{{name="{_label(name)}"}} {_sums[name]:.6f}')
+            lines.append(f'lab_duration_seconds_count{{name="{_label(name)}"}} {cumulative}')
+        lines.append('# HELP lab_rows_total Rows returned by instrumented queries.')
+        lines.append('# TYPE lab_rows_total counter')
+        for name, rows in sorted(_rows.items()):
+            lines.append(f'lab_rows_total{{name="{_label(name)}"}} {rows}')
+    lines.append('# HELP lab_slow_queries Entries currently in the slow query log.')
+    lines.append('# TYPE lab_slow_queries gauge')
+    lines.append(f'lab_slow_queries {len(slow_queries)}')
+    for metric, value in (extra_gauges or {}).items():
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def export(path=METRICS_FILE, extra_gauges=None, force=False):
+    # METRICS_EXPORT_INTERVAL_SECONDS마다 한 번만 파일을 새로 쓴다 (쓰는 도중 읽어도 깨지지 않도록 교체)
+    global _last_export
+    now = time.monotonic()
+    if not force and now - _last_export < METRICS_EXPORT_INTERVAL_SECONDS:
+        return False
+    _last_export = now
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(prometheus_text(extra_gauges))
+    os.replace(temporary, path)
+    return True
+
+
+def reset():
+    global _last_export
+    with _lock:
+        _histograms.clear()
+        _sums.clear()
+        _maxima.clear()
+        _rows.clear()
+        slow_queries.clear()
+        _last_export = 0.0
@@ -0,0 +1,180 @@
+# occupancy.py
+
+import threading
+from collections import namedtuple
+from config import DEFAULT_RESOURCE_ID
+from timeutil import to_day, to_minutes, to_end_minutes, week_bounds
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES  # 48칸
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+
+
+def slot_range(start_time, end_time):
+    # [첫 슬롯, 마지막 슬롯 + 1). 30분 단위가 아닌 시간은 걸치는 슬롯을 모두 포함
+    start = to_minutes(start_time)
+    end = to_end_minutes(end_time, start)
+    return start // SLOT_MINUTES, -(-end // SLOT_MINUTES)
+
+
+def slot_mask(start_time, end_time):
+    first, last = slot_range(start_time, end_time)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+# 빈 시간 검색 결과. start_min ~ end_min 전체가 비어 있다
+FreeWindow = namedtuple('FreeWindow', ['day', 'start_min', 'end_min'])
+
+
+def free_runs(busy, min_slots, first_slot=0):
+    # busy 마스크에서 first_slot 이후 min_slots칸 이상 연속으로 비어 있는 [시작 슬롯, 끝 슬롯) 목록
+    runs = []
+    slot = first_slot
+    while slot < SLOTS_PER_DAY:
+        if busy >> slot & 1:
+            slot += 1
+            continue
+        end = slot + 1
+        while end < SLOTS_PER_DAY and not busy >> end & 1:
+            end += 1
+        if end - slot >= min_slots:
+            runs.append((slot, end))
+        slot = end
+    return runs
+
+
+class OccupancyIndex:
+    # 하루를 48칸 비트마스크로 표현한 예약 점유 인덱스.
+    # (예약 대상, 날짜)별 전체 마스크와 팀별 슬롯 수를 유지해 중복 확인과 주간 사용량 계산을 비트 연산으로 처리한다.
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built = False
+        self._entries = {}  # (resource_id, day) -> {reservation_id: (team, mask)}
+        self._key_of = {}  # reservation_id -> (resource_id, day)
+        self._busy = {}  # (resource_id, day) -> mask
+        self._team_slots = {}  # (resource_id, day) -> {team: 예약된 슬롯 수 합계}
+        self._pending = None  # 다시 만드는 중이면 행을 읽은 뒤 커밋된 변경 [(메서드, 인자)]
+        self._generation = 0  # clear/rebuild마다 증가
+
+    @property
+    def tracking(self):
+        # 커밋된 변경을 반영해야 하는 상태 (만들어져 있거나 다시 만드는 중)
+        return self.built or self._pending is not None
+
+    def _reset(self):
+        self._entries.clear()
+        self._key_of.clear()
+        self._busy.clear()
+        self._team_slots.clear()
+
+    def clear(self):
+        with self._lock:
+            self.built = False
+            self._pending = None
+            self._generation += 1
+            self._reset()
+
+    def begin_rebuild(self):
+        # rebuild에 넘길 행을 읽기 전에 호출. 그 뒤로 들어오는 add/remove는 모아 두었다가 rebuild에서 다시 반영한다
+        with self._lock:
+            self._pending = []
+            return self._generation
+
+    def rebuild(self, rows, generation=None):
+        # rows: (id, resource_id, day, team, start_min, end_min) 목록.
+        # begin_rebuild 이후 clear()로 비워졌으면 (외부 변경) 읽은 행이 오래되었으므로 반영하지 않고 False
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            pending = self._pending or []
+            self._pending = None
+            self._reset()
+            for reservation_id, resource_id, reservation_date, team, start_time, end_time in rows:
+                self._put(reservation_id, (resource_id, to_day(reservation_date)), team, slot_mask(start_time, end_time))
+            for key in list(self._entries):
+                self._refresh(key)
+            # 행을 읽는 동안 커밋된 변경 (이미 읽은 행이어도 같은 결과가 된다)
+            for method, args in pending:
+                method(*args)
+            self._generation += 1
+            self.built = True
+            return True
+
+    def add(self, reservation_id, resource_id, reservation_date, team, start_time, end_time):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.add, (reservation_id, resource_id, reservation_date, team, start_time, end_time)))
+            key = (resource_id, to_day(reservation_date))
+            self._put(reservation_id, key, team, slot_mask(start_time, end_time))
+            self._refresh(key)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.remove, (reservation_id,)))
+            key = self._key_of.pop(reservation_id, None)
+            if key is None:
+                return
+            del self._entries[key][reservation_id]
+            self._refresh(key)
+
+    def day_mask(self, reservation_date, resource_id=DEFAULT_RESOURCE_ID):
+        return self._busy.get((resource_id, to_day(reservation_date)), 0)
+
+    def is_free(self, reservation_date, start_time, end_time, resource_id=DEFAULT_RESOURCE_ID):
+        return not (self.day_mask(reservation_date, resource_id) & slot_mask(start_time, end_time))
+
+    def team_hours(self, team, start_date, end_date, resource_id=DEFAULT_RESOURCE_ID):
+        # start_date ~ end_date(포함) 동안 팀이 해당 대상을 예약한 시간 합계
+        slots = 0
+        for day in range(to_day(start_date), to_day(end_date) + 1):
+            slots += self._team_slots.get((resource_id, day), {}).get(team, 0)
+        return slots * SLOT_MINUTES / 60
+
+    def free_windows(self, start_date, end_date, min_slots, team=None, quota_slots=None, limit=10, first_slot=0,
+                     resource_id=DEFAULT_RESOURCE_ID):
+        # start_date ~ end_date(포함)에서 해당 대상이 min_slots칸 이상 비어 있는 구간을 날짜/시간 순으로 최대 limit개.
+        # quota_slots를 주면 팀이 그 주에 이미 쓴 슬롯에 min_slots를 더해 할당량을 넘는 주는 건너뛴다.
+        # first_slot은 첫날에만 적용 (오늘의 지난 시간 제외)
+        windows = []
+        start = to_day(start_date)
+        used = {}
+        with self._lock:
+            for day in range(start, to_day(end_date) + 1):
+                if quota_slots is not None:
+                    monday, sunday = week_bounds(day)
+                    if monday not in used:
+                        used[monday] = sum(self._team_slots.get((resource_id, d), {}).get(team, 0) for d in range(monday, sunday + 1))
+                    if used[monday] + min_slots > quota_slots:
+                        continue
+                for first, last in free_runs(self._busy.get((resource_id, day), 0), min_slots, first_slot if day == start else 0):
+                    windows.append(FreeWindow(day, first * SLOT_MINUTES, last * SLOT_MINUTES))
+                    if len(windows) >= limit:
+                        return windows
+        return windows
+
+    def _put(self, reservation_id, key, team, mask):
+        old_key = self._key_of.get(reservation_id)
+        if old_key is not None and old_key != key:
+            del self._entries[old_key][reservation_id]
+            self._refresh(old_key)
+        self._entries.setdefault(key, {})[reservation_id] = (team, mask)
+        self._key_of[reservation_id] = key
+
+    def _refresh(self, key):
+        # 해당 (대상, 날짜)의 마스크만 다시 계산 (예약 수가 적어 사실상 상수 시간)
+        busy = 0
+        team_slots = {}
+        for team, mask in self._entries.get(key, {}).values():
+            busy |= mask
+            team_slots[team] = team_slots.get(team, 0) + bin(mask).count('1')
+        if self._entries.get(key):
+            self._busy[key] = busy
+            self._team_slots[key] = team_slots
+        else:
+            self._entries.pop(key, None)
+            self._busy.pop(key, None)
+            self._team_slots.pop(key, None)
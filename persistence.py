@@ -0,0 +1,222 @@
+# persistence.py
+
+import atexit
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+import archive
+import database
+import metrics
+from config import (GITHUB_REPO_NAME, GITHUB_BRANCH, GITHUB_SNAPSHOT_PATH, PERSIST_DELAY_SECONDS,
+                    PERSIST_MAX_RETRIES, PERSIST_BACKOFF_SECONDS)
+
+
+def github_repo():
+    # PyGithub은 실제로 업로드할 때만 불러온다
+    from github import Github
+    return Github(os.getenv("GITHUB_TOKEN")).get_repo(GITHUB_REPO_NAME)
+
+
+def snapshot(source_file=None):
+    # sqlite backup API로 일관된 스냅샷을 떠서 gzip으로 압축 (쓰기 중에도 안전). source_file이 없으면 현재 DB
+    memory = sqlite3.connect(':memory:')
+    try:
+        if source_file is None:
+            with database.connection() as conn:
+                conn.backup(memory)
+        else:
+            # 읽기 전용으로 열어 없는 파일을 빈 DB로 만들지 않는다
+            source = sqlite3.connect(f"file:{pathname2url(os.path.abspath(source_file))}?mode=ro", uri=True)
+            try:
+                source.backup(memory)
+            finally:
+                source.close()
+        return gzip.compress(memory.serialize(), mtime=0)
+    finally:
+        memory.close()
+
+
+def download_snapshot(target=None, path=GITHUB_SNAPSHOT_PATH):
+    # GitHub에 올라간 압축 스냅샷(현재 DB는 없으면 예전 방식의 raw reservation.db)을 받아 target에 저장
+    import requests
+    target = target or database.DATABASE_FILE
+    base_url = f"https://github.com/{GITHUB_REPO_NAME}/raw/{GITHUB_BRANCH}"
+    response = requests.get(f"{base_url}/{path}", timeout=30)
+    if response.status_code == 200:
+        content = gzip.decompress(response.content)
+    else:
+        if path != GITHUB_SNAPSHOT_PATH:
+            response.raise_for_status()
+        response = requests.get(f"{base_url}/{os.path.basename(target)}", timeout=30)
+        response.raise_for_status()
+        content = response.content
+    with open(target, "wb") as f:
+        f.write(content)
+
+
+class LocalRepo:
+    # PyGithub Repository의 get_contents/create_file/update_file만 흉내 내는 로컬 디렉터리 저장소 (테스트, 부하 테스트용)
+
+    class _Content:
+        def __init__(self, path, sha):
+            self.path = path
+            self.sha = sha
+
+    class NotFound(Exception):
+        status = 404
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.commits = []
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, path, message, content):
+        os.makedirs(os.path.dirname(os.path.join(self.directory, path)), exist_ok=True)
+        with open(os.path.join(self.directory, path), "wb") as f:
+            f.write(content)
+        sha = hashlib.sha1(content).hexdigest()
+        self.commits.append((message, path, sha))
+        return {'content': self._Content(path, sha), 'commit': None}
+
+    def get_contents(self, path):
+        try:
+            with open(os.path.join(self.directory, path), "rb") as f:
+                return self._Content(path, hashlib.sha1(f.read()).hexdigest())
+        except FileNotFoundError:
+            raise self.NotFound(path)
+
+    def create_file(self, path, message, content):
+        return self._write(path, message, content)
+
+    def update_file(self, path, message, content, sha):
+        if self.get_contents(path).sha != sha:
+            raise Exception(f"409 sha mismatch for {path}")
+        return self._write(path, message, content)
+
+
+class SnapshotPersistence:
+    # 쓰기가 일어나면 PERSIST_DELAY_SECONDS 동안 모아 두었다가 백그라운드에서 스냅샷 하나만 올린다.
+    # 실패하면 지수 백오프로 재시도하며, 예약 요청 경로는 GitHub 응답을 기다리지 않는다.
+
+    def __init__(self, repo_factory=github_repo, path=GITHUB_SNAPSHOT_PATH, delay=PERSIST_DELAY_SECONDS,
+                 max_retries=PERSIST_MAX_RETRIES, backoff=PERSIST_BACKOFF_SECONDS, sleep=time.sleep, source=snapshot):
+        self.repo_factory = repo_factory
+        self.path = path
+        self.source = source
+        self.delay = delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.pushes = 0
+        self.last_error = None
+        self.last_push_time = None
+        self._repo = None
+        self._sha = None
+        self._last_digest = None
+        self._dirty = threading.Event()
+        self._push_lock = threading.Lock()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def schedule(self, *tables):
+        # database.committed() 리스너. 업로드 예약만 하고 바로 돌아온다
+        self._dirty.set()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='snapshot-persistence', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            # 창(window) 동안 들어온 쓰기를 하나로 합친다
+            time.sleep(self.delay)
+            self.flush()
+
+    def flush(self):
+        # 대기 중인 변경이 있으면 지금 바로 업로드. 성공하면 True
+        with self._push_lock:
+            if not self._dirty.is_set():
+                return True
+            self._dirty.clear()
+            try:
+                with metrics.timer('persist.snapshot'):
+                    data = self.source()
+            except sqlite3.Error as e:
+                self.last_error = e
+                self._dirty.set()
+                return False
+            digest = hashlib.sha1(data).hexdigest()
+            if digest == self._last_digest:
+                return True
+            for attempt in range(self.max_retries):
+                try:
+                    with metrics.timer('persist.push'):
+                        self._push(data)
+                    self._last_digest = digest
+                    self.pushes += 1
+                    self.last_error = None
+                    self.last_push_time = time.time()
+                    return True
+                except Exception as e:
+                    self.last_error = e
+                    self._sha = None  # sha가 어긋났을 수 있으므로 다음 시도에서 다시 조회
+                    self.sleep(self.backoff * 2 ** attempt)
+            # 모두 실패하면 다음 주기에 다시 시도
+            self._dirty.set()
+            return False
+
+    def _push(self, data):
+        if self._repo is None:
+            self._repo = self.repo_factory()
+        message = "Update reservation database snapshot"
+        if self._sha is None:
+            try:
+                self._sha = self._repo.get_contents(self.path).sha
+            except Exception as e:
+                if getattr(e, 'status', None) != 404:
+                    raise
+                result = self._repo.create_file(self.path, "Create reservation database snapshot", data)
+                self._sha = result['content'].sha
+                return
+        result = self._repo.update_file(self.path, message, data, self._sha)
+        self._sha = result['content'].sha
+
+
+_service = None
+_archive_services = {}
+_service_lock = threading.Lock()
+
+
+def _schedule_archives(*tables):
+    # 예약이 보관 파일로 옮겨지면 행을 옮겨 넣은 보관 파일만 올린다 (내려받지 않은 파일은 올리지 않는다)
+    if 'archives' not in tables:
+        return
+    for name in archive.take_written():
+        if not os.path.exists(archive.archive_file(name)):
+            continue
+        with _service_lock:
+            service = _archive_services.get(name)
+            if service is None:
+                service = SnapshotPersistence(_service.repo_factory, archive.remote_path(name),
+                                              source=lambda name=name: snapshot(archive.archive_file(name)))
+                _archive_services[name] = service
+                atexit.register(service.flush)
+        service.schedule()
+
+
+def start(repo_factory=github_repo):
+    # 프로세스당 한 번만 서비스를 만들고 DB 커밋 리스너로 등록
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SnapshotPersistence(repo_factory)
+            database.add_commit_listener(_service.schedule)
+            database.add_commit_listener(_schedule_archives)
+            atexit.register(_service.flush)
+    return _service
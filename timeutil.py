@@ -0,0 +1,64 @@
+# timeutil.py
+
+from datetime import date, datetime, time, timedelta
+from numbers import Integral
+
+# 예약 시간 저장 형식
+#   day       : 1970-01-01부터 센 날짜 번호 (INTEGER)
+#   start_min : 자정 기준 시작 분 (0 ~ 1439)
+#   end_min   : 자정 기준 종료 분 (1 ~ 1440, 1440은 24:00)
+# DB를 읽고 쓰는 모든 코드는 이 모듈의 함수로만 변환한다.
+
+EPOCH = date(1970, 1, 1)
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_day(value):
+    # date / 'YYYY-MM-DD' / 날짜 번호(int) -> 날짜 번호
+    if isinstance(value, Integral):
+        return int(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return (value - EPOCH).days
+
+
+def from_day(day):
+    return EPOCH + timedelta(days=int(day))
+
+
+def to_minutes(value):
+    # datetime.time / 'HH:MM' / 'HH:MM:SS' / 분(int) -> 자정 기준 분
+    if isinstance(value, Integral):
+        return int(value)
+    if isinstance(value, (time, datetime)):
+        return value.hour * 60 + value.minute
+    hour, minute = str(value).split(':')[:2]
+    return int(hour) * 60 + int(minute)
+
+
+def to_end_minutes(value, start_minutes=0):
+    # 종료 시각은 00:00을 자정(24:00)으로 본다
+    minutes = to_minutes(value)
+    return MINUTES_PER_DAY if minutes == 0 and start_minutes > 0 else minutes
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def week_bounds(day):
+    # 날짜 번호가 속한 주의 (월요일, 일요일) 날짜 번호. 1970-01-01은 목요일
+    monday = day - (day + 3) % 7
+    return monday, monday + 6
+
+
+def sql_date(column):
+    # SQL 안에서 날짜 번호를 'YYYY-MM-DD'로 표시
+    return f"date({column} * 86400, 'unixepoch')"
+
+
+def sql_time(column):
+    # SQL 안에서 분을 'HH:MM'으로 표시
+    return f"printf('%02d:%02d', {column} / 60, {column} % 60)"
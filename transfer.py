@@ -0,0 +1,195 @@
+# transfer.py
+
+import argparse
+import os
+import sys
+import database
+import writer
+from archive import horizon
+from database import ImportResult, INVALID_TIME, UNKNOWN_RESOURCE
+from config import EXPORT_CHUNK_SIZE, DEFAULT_RESOURCE_ID
+from metrics import instrument
+from timeutil import to_day, to_minutes, to_end_minutes, MINUTES_PER_DAY
+
+# 예약/유저를 CSV, Parquet으로 내보내고 외부 시간표를 가져온다.
+# 내보내기는 EXPORT_CHUNK_SIZE행씩 읽고 바로 써서 전체 데이터를 메모리에 올리지 않는다.
+# 사용법: python transfer.py export reservations out.csv [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--team 팀] [--resource 대상]
+#         python transfer.py export users users.parquet
+#         python transfer.py import schedule.csv [--skip-conflicts] [--shift-weeks N]
+
+EXPORT_COLUMNS = ('id', 'student_id', 'name', 'team', 'resource', 'reservation_date', 'start_time', 'end_time')
+IMPORT_COLUMNS = ('student_id', 'reservation_date', 'start_time', 'end_time')
+RESOURCE_COLUMN = 'resource'  # 가져오는 파일에 없으면 모두 기본 대상으로 가져온다
+INTEGER_COLUMNS = {'id', 'resource_id', 'day', 'start_min', 'end_min'}
+ARCHIVED = "보관 기간이 지난 날짜입니다."
+
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    if extension == '.csv':
+        return 'csv'
+    raise ValueError(f"Unknown file format: {path} (use .csv or .parquet)")
+
+
+def write_chunks(chunks, target, fmt):
+    # DataFrame chunk들을 target(경로 또는 바이너리 파일 객체)에 차례로 쓴다. 쓴 행 수를 돌려준다
+    rows = 0
+    if fmt == 'csv':
+        import io
+        close = isinstance(target, (str, os.PathLike))
+        f = open(target, 'wb') if close else target
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        try:
+            for chunk in chunks:
+                chunk.to_csv(text, header=rows == 0, index=False)
+                rows += len(chunk)
+        finally:
+            # 호출한 쪽이 넘긴 파일 객체는 닫지 않는다
+            if close:
+                text.close()
+            else:
+                text.flush()
+                text.detach()
+        return rows
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parquet = None
+    try:
+        for chunk in chunks:
+            if parquet is None:
+                schema = pa.schema([(c, pa.int64() if c in INTEGER_COLUMNS else pa.string()) for c in chunk.columns])
+                parquet = pq.ParquetWriter(target, schema)
+            parquet.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if parquet is not None:
+            parquet.close()
+    return rows
+
+
+@instrument('transfer.export_reservations')
+def export_reservations(target, fmt=None, start_date=None, end_date=None, team=None,
+                        columns=EXPORT_COLUMNS, chunksize=EXPORT_CHUNK_SIZE, resource_id=None):
+    # 보관 파일을 포함한 예약을 날짜 범위/팀/예약 대상으로 걸러 내보낸다. 내보낸 행 수를 돌려준다
+    chunks = database.iter_reservations(start_date, end_date, team, columns, chunksize, resource_id)
+    return write_chunks(chunks, target, file_format(target, fmt))
+
+
+@instrument('transfer.export_users')
+def export_users(target, fmt=None, chunksize=EXPORT_CHUNK_SIZE):
+    return write_chunks(database.iter_users(chunksize), target, file_format(target, fmt))
+
+
+def read_chunks(source, fmt, chunksize=EXPORT_CHUNK_SIZE):
+    # 가져올 파일을 chunksize행씩 읽는다 (모든 값은 문자열 또는 정수)
+    if fmt == 'csv':
+        import pandas as pd
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunksize)
+        return
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def columns_of(source, fmt):
+    if fmt == 'csv':
+        import pandas as pd
+        columns = list(pd.read_csv(source, nrows=0).columns)
+    else:
+        import pyarrow.parquet as pq
+        columns = pq.ParquetFile(source).schema_arrow.names
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return columns
+
+
+def parse_rows(chunks, shift_days=0, first_day=None, resource_ids=None):
+    # (행 번호, student_id, resource_id, day, start_min, end_min, 사유). 행 번호는 헤더를 1행으로 센 파일 기준.
+    # resource_ids({대상 이름: id})를 주면 resource 컬럼의 이름을 id로 바꾼다
+    line = 1
+    for chunk in chunks:
+        resources = chunk[RESOURCE_COLUMN] if resource_ids is not None else [None] * len(chunk)
+        for (student_id, reservation_date, start_time, end_time), resource in zip(
+                chunk[list(IMPORT_COLUMNS)].itertuples(index=False, name=None), resources):
+            line += 1
+            resource_id = DEFAULT_RESOURCE_ID if resource_ids is None else resource_ids.get(resource)
+            try:
+                day = to_day(reservation_date) + shift_days
+                start = to_minutes(start_time)
+                end = to_end_minutes(end_time, start)
+            except (TypeError, ValueError):
+                yield line, str(student_id), resource_id, None, None, None, INVALID_TIME
+                continue
+            if not 0 <= start < end <= MINUTES_PER_DAY:
+                yield line, str(student_id), resource_id, None, None, None, INVALID_TIME
+            elif resource_id is None:
+                yield line, str(student_id), None, day, start, end, UNKNOWN_RESOURCE
+            elif first_day is not None and day < first_day:
+                yield line, str(student_id), resource_id, day, start, end, ARCHIVED
+            else:
+                yield line, str(student_id), resource_id, day, start, end, None
+
+
+@instrument('transfer.import_reservations')
+def import_reservations(source, fmt=None, skip_conflicts=False, shift_weeks=0, chunksize=EXPORT_CHUNK_SIZE):
+    # 외부 시간표(예: 지난 학기 내보내기 파일)를 한 트랜잭션으로 가져온다. shift_weeks만큼 날짜를 옮길 수 있다.
+    # 보관 기간이 지난 날짜는 보관 파일과의 중복을 확인할 수 없으므로 받지 않는다.
+    # 파일 읽기와 행 검사는 writer 밖에서 끝내고, writer는 모아 둔 행의 중복 확인과 삽입만 한다
+    fmt = file_format(getattr(source, 'name', source), fmt)
+    columns = columns_of(source, fmt)
+    missing = set(IMPORT_COLUMNS) - set(columns)
+    if missing:
+        return ImportResult(False, f"필수 컬럼이 없습니다: {', '.join(sorted(missing))}", 0, [])
+    resource_ids = {r.name: r.id for r in database.get_resources()} if RESOURCE_COLUMN in columns else None
+    rows = parse_rows(read_chunks(source, fmt, chunksize), shift_weeks * 7, horizon(), resource_ids)
+    batch = database.stage_import(rows, chunksize)
+    try:
+        return writer.modify(database.load_reservations, batch, skip_conflicts)
+    finally:
+        # writer에서 실패해 남은 작업 행도 지운다
+        database.discard_import(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import reservations as CSV or Parquet.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export')
+    export.add_argument('table', choices=['reservations', 'users'])
+    export.add_argument('target')
+    export.add_argument('--start')
+    export.add_argument('--end')
+    export.add_argument('--team')
+    export.add_argument('--resource', help="resource name")
+    imports = commands.add_parser('import')
+    imports.add_argument('source')
+    imports.add_argument('--skip-conflicts', action='store_true', help="import the valid rows and report the rest")
+    imports.add_argument('--shift-weeks', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.command == 'export':
+        if args.table == 'users':
+            rows = export_users(args.target)
+        else:
+            resource_ids = {r.name: r.id for r in database.get_resources()}
+            if args.resource is not None and args.resource not in resource_ids:
+                print(f"unknown resource: {args.resource} (one of {', '.join(resource_ids)})")
+                return 1
+            rows = export_reservations(args.target, start_date=args.start, end_date=args.end, team=args.team,
+                                       resource_id=resource_ids.get(args.resource))
+        print(f"{args.target}: {rows} rows")
+        return 0
+    result = import_reservations(args.source, skip_conflicts=args.skip_conflicts, shift_weeks=args.shift_weeks)
+    print(f"imported {result.imported} rows, rejected {len(result.rejected)}" + (f": {result.reason}" if result.reason else ""))
+    for line, reason in result.rejected[:20]:
+        print(f"  line {line}: {reason}")
+    return 0 if result.accepted else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# writer.py
+
+import logging
+import queue
+import threading
+import cache
+import database
+import metrics
+from database import ReservationResult, CONFLICT, QUOTA_EXCEEDED, UNKNOWN_USER, UNKNOWN_RESOURCE, INVALID_TIME
+from timeutil import to_day, to_minutes, to_end_minutes, week_bounds
+from config import DEFAULT_RESOURCE_ID, WRITER_BATCH_SIZE, WRITER_BATCH_WINDOW_MS
+
+log = logging.getLogger(__name__)
+
+
+class _Request:
+    # run(conn) -> (결과, 점유 인덱스에 반영할 (id, resource_id, day, team, start_min, end_min) 목록, 인덱스에서 뺄 id 목록)
+    __slots__ = ('run', 'done', 'result', 'indexed', 'removed')
+
+    def __init__(self, run):
+        self.run = run
+        self.done = threading.Event()
+        self.result = None
+        self.indexed = []
+        self.removed = []
+
+
+class ReservationWriter:
+    # 예약 쓰기를 전담하는 단일 백그라운드 스레드.
+    # 큐에 쌓인 요청을 모아 BEGIN IMMEDIATE 트랜잭션 하나에서 중복/할당량 확인과 삽입을 처리하고 한 번에 커밋한다.
+
+    def __init__(self, batch_size=WRITER_BATCH_SIZE, batch_window_ms=WRITER_BATCH_WINDOW_MS):
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, student_id, start_time, end_time, reservation_date, resource_id=DEFAULT_RESOURCE_ID):
+        # 예약 한 건을 큐에 넣고 처리 결과(ReservationResult)를 기다린다
+        start = to_minutes(start_time)
+        end = to_end_minutes(end_time, start)
+        day = to_day(reservation_date)
+        return self.execute(lambda conn: _check_and_insert(conn, student_id, day, start, end, resource_id),
+                            ReservationResult(False, None, None))
+
+    def execute(self, run, error_result):
+        # writer 트랜잭션 안에서 run(conn)을 실행하고 결과를 기다린다.
+        # 처리 중 오류가 나면 error_result(reason만 채워서)를 돌려준다
+        self._ensure_started()
+        request = _Request(run)
+        request.result = error_result
+        # 큐 대기 시간을 포함한 요청 하나의 응답 시간
+        with metrics.timer('writer.request'):
+            self._queue.put(request)
+            request.done.wait()
+        return request.result
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='reservation-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 짧은 시간 동안 들어오는 요청을 모아 한 번에 커밋 (group commit)
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.batch_window))
+            except queue.Empty:
+                pass
+            try:
+                with metrics.timer('writer.commit') as record:
+                    record['rows'] = len(batch)
+                    self._commit(batch)
+            except Exception:
+                # 배치 하나의 오류로 writer 스레드가 멈추지 않게 한다 (요청은 _commit에서 이미 끝났다)
+                log.exception("Reservation writer batch failed after commit")
+
+    def _commit(self, batch):
+        try:
+            with database.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for request in batch:
+                        # 요청 하나의 오류가 배치 전체를 되돌리지 않도록 savepoint로 감싼다
+                        conn.execute('SAVEPOINT request')
+                        try:
+                            request.result, request.indexed, request.removed = request.run(conn)
+                        except Exception as e:
+                            # 잘못된 작업 하나가 같은 배치의 다른 예약까지 실패시키지 않도록 해당 요청만 되돌린다
+                            conn.execute('ROLLBACK TO request')
+                            request.result = _failed(request.result, e)
+                        conn.execute('RELEASE request')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except Exception as e:
+            for request in batch:
+                request.result = _failed(request.result, e)
+                request.indexed = []
+                request.removed = []
+        try:
+            indexed = [row for request in batch for row in request.indexed]
+            removed = [reservation_id for request in batch for reservation_id in request.removed]
+            if indexed or removed:
+                database.committed('reservations')
+            else:
+                # 예약은 바뀌지 않았어도 커밋(가져오기 작업 행 정리 등)을 외부 변경으로 보지 않게 한다
+                cache.invalidate()
+            for reservation_id in removed:
+                database.unindex_reservation(reservation_id)
+            for row in indexed:
+                database.index_reservation(*row)
+        except Exception:
+            # 커밋은 끝났으므로 결과는 그대로 돌려주고, 어긋났을 수 있는 점유 인덱스는 다음 조회 때 다시 만든다
+            database.clear_occupancy()
+            raise
+        finally:
+            # 커밋 후 처리(리스너, 인덱스)가 실패해도 기다리는 요청이 멈추지 않도록 항상 깨운다
+            for request in batch:
+                request.done.set()
+
+
+def _failed(result, error):
+    # 결과 형태(ReservationResult, ImportResult, 그 목록)는 유지하고 실패 사유만 채운다
+    reason = f"예약 처리 중 오류가 발생했습니다: {error}"
+    if isinstance(result, list):
+        return [item._replace(accepted=False, reason=reason) for item in result]
+    return result._replace(accepted=False, reason=reason)
+
+
+def _check_and_insert(conn, student_id, day, start_min, end_min, resource_id=DEFAULT_RESOURCE_ID):
+    # 같은 트랜잭션 안에서 확인 후 삽입하므로 같은 배치의 앞선 요청도 중복 확인에 반영된다.
+    # 중복과 할당량은 예약 대상마다 따로 확인한다
+    if start_min >= end_min:
+        return ReservationResult(False, INVALID_TIME, None), [], []
+    user = conn.execute("SELECT team FROM users WHERE student_id = ?", (student_id,)).fetchone()
+    if user is None:
+        return ReservationResult(False, UNKNOWN_USER, None), [], []
+    team = user[0]
+    quota = database.quota_minutes(conn, resource_id)
+    if quota is None:
+        return ReservationResult(False, UNKNOWN_RESOURCE, None), [], []
+
+    overlap = database.timed_execute(conn, """
+        SELECT 1 FROM reservations
+        WHERE resource_id = ? AND day = ?
+        AND start_min < ? AND end_min > ?
+        LIMIT 1
+    """, (resource_id, day, end_min, start_min)).fetchone()
+    if overlap:
+        return ReservationResult(False, CONFLICT, None), [], []
+
+    if team is not None:
+        monday, sunday = week_bounds(day)
+        reserved_minutes = database.timed_execute(conn, """
+            SELECT COALESCE(SUM(r.end_min - r.start_min), 0)
+            FROM reservations r
+            JOIN users u ON r.student_id = u.student_id
+            WHERE u.team = ? AND r.resource_id = ?
+            AND r.day BETWEEN ? AND ?
+        """, (team, resource_id, monday, sunday)).fetchone()[0]
+        if reserved_minutes + end_min - start_min > quota:
+            return ReservationResult(False, QUOTA_EXCEEDED, None), [], []
+
+    reservation_id = conn.execute("""
+        INSERT INTO reservations (student_id, resource_id, day, start_min, end_min)
+        VALUES (?, ?, ?, ?, ?)
+    """, (student_id, resource_id, day, start_min, end_min)).lastrowid
+    return ReservationResult(True, None, reservation_id), [(reservation_id, resource_id, day, team, start_min, end_min)], []
+
+
+# 프로세스 전체에서 공유하는 writer
+_writer = ReservationWriter()
+
+
+def reserve(student_id, start_time, end_time, reservation_date, resource_id=DEFAULT_RESOURCE_ID):
+    return _writer.submit(student_id, start_time, end_time, reservation_date, resource_id)
+
+
+def reserve_many(student_id, slots, all_or_nothing=True, resource_id=DEFAULT_RESOURCE_ID):
+    # 한 대상의 여러 슬롯(반복 예약 등)을 한 번에 확인/저장. 슬롯마다 ReservationResult 목록을 돌려준다
+    slots = list(slots)
+    return _writer.execute(lambda conn: database.book_slots(conn, student_id, slots, all_or_nothing, resource_id),
+                           [ReservationResult(False, None, None) for _ in slots])
+
+
+def modify(change, *args):
+    # 관리자 일괄 작업(database.delete_reservations, shift_reservations 등)을 writer 트랜잭션 하나로 실행
+    return _writer.execute(lambda conn: change(conn, *args), ReservationResult(False, None, None))